@@ -0,0 +1,144 @@
+from sqlalchemy import text
+
+from app.config import engine
+from app.cache import bump_version
+
+# Hire counts grouped the same way as hired_employees_quarterly, computed from the raw table
+RAW_QUARTERLY_SQL = """
+    SELECT
+        DATE_PART('year', h.datetime::timestamp)::int AS year,
+        DATE_PART('quarter', h.datetime::timestamp)::int AS quarter,
+        h.department_id,
+        h.job_id,
+        COUNT(*)::int AS hired
+    FROM
+        hired_employees h
+    WHERE
+        h.datetime IS NOT NULL
+        {filter}
+    GROUP BY
+        1, 2, 3, 4
+"""
+
+apply_deltas_stmt = text(f"""
+    INSERT INTO hired_employees_quarterly AS q (year, quarter, department_id, job_id, hired)
+    SELECT
+        year,
+        quarter,
+        department_id,
+        job_id,
+        :sign * hired
+    FROM (
+        {RAW_QUARTERLY_SQL.format(filter='AND h.id = ANY(CAST(:ids AS INTEGER[]))')}
+    ) deltas
+    -- Aggregate rows are locked in key order, so concurrent writers can not deadlock
+    ORDER BY year, quarter, department_id, job_id
+    ON CONFLICT ON CONSTRAINT uq_hired_employees_quarterly
+    DO UPDATE SET hired = q.hired + EXCLUDED.hired
+""")
+
+# Writer lock of hired_employees, the one taken by app.partitions.lock_keys
+lock_writers_stmt = text("""
+    SELECT pg_advisory_xact_lock(hashtext('keys:hired_employees'))
+""")
+
+prune_stmt = text("""
+    DELETE FROM hired_employees_quarterly WHERE hired = 0
+""")
+
+rebuild_stmt = text(f"""
+    INSERT INTO hired_employees_quarterly (year, quarter, department_id, job_id, hired)
+    {RAW_QUARTERLY_SQL.format(filter='')}
+""")
+
+check_stmt = text(f"""
+    WITH raw AS (
+        {RAW_QUARTERLY_SQL.format(filter='')}
+    ),
+    stored AS (
+        SELECT year, quarter, department_id, job_id, hired
+        FROM hired_employees_quarterly
+    )
+    SELECT
+        (SELECT COUNT(*) FROM (SELECT * FROM raw EXCEPT SELECT * FROM stored) m) AS missing,
+        (SELECT COUNT(*) FROM (SELECT * FROM stored EXCEPT SELECT * FROM raw) u) AS unexpected
+""")
+
+
+def apply_quarterly_deltas(conn, ids: list[int], sign: int):
+    """
+    Add (sign=1) or subtract (sign=-1) the current hired_employees rows with the given ids
+    to the quarterly aggregates. Run it in the same transaction as the write, holding the
+    writer lock (lock_keys): subtract before rows are changed or deleted and add after rows
+    are inserted or changed.
+
+    Args:
+        conn (Connection): Open SQLAlchemy connection with the write transaction.
+        ids (list[int]): Ids of the hired_employees rows.
+        sign (int): 1 to add the rows, -1 to subtract them.
+    """
+    if not ids:
+        return
+
+    conn.execute(apply_deltas_stmt, {'ids': ids, 'sign': sign})
+    conn.execute(prune_stmt)
+
+
+def rebuild_quarterly_aggregates(conn):
+    """
+    Recompute the quarterly aggregates from scratch.
+
+    Args:
+        conn (Connection): Open SQLAlchemy connection.
+    """
+    # Writers waiting on the lock apply their deltas over the rebuilt counts
+    conn.execute(lock_writers_stmt)
+    conn.execute(text('DELETE FROM hired_employees_quarterly'))
+    conn.execute(rebuild_stmt)
+
+
+def init_quarterly_aggregates():
+    """
+    Backfill the quarterly aggregates when they are empty but hired_employees has data,
+    e.g. the first start after the aggregates table was added.
+    """
+    with engine.begin() as conn:
+        needs_backfill = conn.execute(text("""
+            SELECT
+                NOT EXISTS (SELECT 1 FROM hired_employees_quarterly)
+                AND EXISTS (SELECT 1 FROM hired_employees)
+        """)).scalar()
+
+        if needs_backfill:
+            rebuild_quarterly_aggregates(conn)
+
+
+def check_quarterly_aggregates(repair: bool = False) -> dict:
+    """
+    Compare the quarterly aggregates with the counts computed from the raw hired_employees table.
+
+    Args:
+        repair (bool): Rebuild the aggregates when they are not consistent.
+
+    Returns:
+        dict: Number of raw groups missing in the aggregates, groups only in the aggregates,
+            whether both match and whether they were rebuilt.
+    """
+    with engine.begin() as conn:
+        missing, unexpected = conn.execute(check_stmt).one()
+        consistent = missing == 0 and unexpected == 0
+
+        repaired = False
+        if repair and not consistent:
+            rebuild_quarterly_aggregates(conn)
+            repaired = True
+
+    if repaired:
+        bump_version('hired_employees')
+
+    return {
+        'consistent': consistent,
+        'missing': missing,
+        'unexpected': unexpected,
+        'repaired': repaired
+    }
@@ -0,0 +1,169 @@
+import asyncio
+import pandas as pd
+import numpy as np
+
+from app.models import metadata
+from app.config import BATCH_FLUSH_SECONDS, BATCH_FLUSH_ROWS
+from app.concurrency import run_db
+from app.utils import update_records, reject_invalid
+from app.results import OperationResult
+
+# Requests waiting for the next flush, by table: lists of (DataFrame, future)
+pending_batches = {}
+pending_rows = {}
+
+# Timers that flush a table when its window ends, and flushes still writing
+flush_timers = {}
+flush_tasks = set()
+
+
+def records_to_frame(table_name: str, records: list) -> pd.DataFrame:
+    """
+    Build a DataFrame with the table columns from validated Pydantic records.
+
+    Args:
+        table_name (str): Name of the table.
+        records (list): Validated records of the table model.
+
+    Returns:
+        pd.DataFrame: One row per record.
+    """
+    columns = metadata.tables[table_name].columns.keys()
+
+    return pd.DataFrame.from_records(
+        [record.model_dump() for record in records],
+        columns=columns
+    )
+
+
+def flush(table_name: str):
+    """Send every pending request of a table to the DB as one upsert."""
+    timer = flush_timers.pop(table_name, None)
+    if timer:
+        timer.cancel()
+
+    batch = pending_batches.pop(table_name, [])
+    pending_rows.pop(table_name, None)
+
+    if batch:
+        task = asyncio.create_task(write_batch(table_name, batch))
+        flush_tasks.add(task)
+        task.add_done_callback(flush_tasks.discard)
+
+
+def validate_requests(table_name: str, batch: list, results: list[OperationResult]) -> pd.DataFrame:
+    """
+    Validate every request of a batch on its own, so rejected rows go to the reject file
+    of their request, and concatenate the valid rows.
+
+    Args:
+        table_name (str): Name of the table.
+        batch (list): Pending (DataFrame, future) pairs.
+        results (list[OperationResult]): Result of every request, rejects are counted in them.
+
+    Returns:
+        pd.DataFrame: Valid rows of all the requests, with the index of their request in 'request'.
+    """
+    table = metadata.tables[table_name]
+    frames = [
+        reject_invalid(request_df, table, result).assign(request=index)
+        for index, ((request_df, _), result) in enumerate(zip(batch, results))
+    ]
+
+    return pd.concat(frames, ignore_index=True)
+
+
+def request_counts(df: pd.DataFrame, written: pd.DataFrame, results: list[OperationResult]):
+    """
+    Split the written rows of a batch among its requests. A key sent by several requests
+    belongs to the last one, like the upsert keeps its last occurrence; the other valid
+    rows of a request are counted as skipped (unchanged or superseded).
+
+    Args:
+        df (pd.DataFrame): Valid rows of the batch with their 'request'.
+        written (pd.DataFrame): Keys written by update_records with their 'inserted' flag.
+        results (list[OperationResult]): Result of every request.
+    """
+    owners = df.drop_duplicates(subset='id', keep='last').set_index('id')['request']
+    written_requests = owners.reindex(written['id']).to_numpy()
+    inserted = written['inserted'].to_numpy(dtype=bool)
+    valid_rows = df['request'].value_counts()
+
+    for index, result in enumerate(results):
+        mine = written_requests == index
+        result.inserted = int(np.count_nonzero(mine & inserted))
+        result.updated = int(np.count_nonzero(mine & ~inserted))
+        result.affected_rows = result.inserted + result.updated
+        result.skipped = int(valid_rows.get(index, 0)) - result.affected_rows
+
+
+async def write_batch(table_name: str, batch: list):
+    """
+    Upsert the coalesced requests of a table in one transaction and answer every request
+    with the counts and reject file of its own rows.
+
+    Args:
+        table_name (str): Name of the table.
+        batch (list): Pending (DataFrame, future) pairs.
+    """
+    results = [OperationResult('batch_insert') for _ in batch]
+    df = None
+
+    try:
+        df = await run_db(validate_requests, table_name, batch, results)
+        result = await run_db(
+            update_records, table_name, df.drop(columns='request'), ['id'], 'copy', return_keys=True
+        )
+
+        if result.ok:
+            await run_db(request_counts, df, result.frame, results)
+
+    except Exception as e:
+        result = OperationResult('update', message=str(e))
+
+    for (request_df, future), request_result in zip(batch, results):
+        if result.ok:
+            request_result.succeed()
+            if request_result.affected_rows == 0:
+                request_result.message = 'No changes detected in the provided data.'
+        else:
+            request_result.message = result.message
+
+        request_result.data = {
+            'rows': request_df.shape[0],
+            'coalesced_requests': len(batch),
+            'batch_rows': 0 if df is None else df.shape[0]
+        }
+
+        if not future.done():
+            future.set_result(request_result)
+
+
+async def submit_batch(table_name: str, records: list) -> OperationResult:
+    """
+    Queue records for the next flush of their table and wait for its result.
+
+    Requests arriving within BATCH_FLUSH_SECONDS of each other are merged into one
+    transaction; a table is flushed early once BATCH_FLUSH_ROWS rows are pending.
+
+    Args:
+        table_name (str): Name of the table.
+        records (list): Validated records of the table model.
+
+    Returns:
+        OperationResult: Counts and reject file of the rows of this request in the flushed batch.
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+
+    df = records_to_frame(table_name, records)
+    pending_batches.setdefault(table_name, []).append((df, future))
+    pending_rows[table_name] = pending_rows.get(table_name, 0) + df.shape[0]
+
+    if pending_rows[table_name] >= BATCH_FLUSH_ROWS:
+        flush(table_name)
+
+    elif table_name not in flush_timers:
+        flush_timers[table_name] = loop.call_later(BATCH_FLUSH_SECONDS, flush, table_name)
+
+    return await future
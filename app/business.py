@@ -1,49 +1,71 @@
-from sqlalchemy import Table, Integer, String, DateTime, or_
+from sqlalchemy import Table, Integer, BigInteger, String, DateTime, or_, text
 from psycopg2.extensions import register_adapter, AsIs
 import pandas as pd
 import numpy as np
 
+from datetime import datetime
 import os
 
-from app.models import metadata
-from app.config import engine
+from app.config import read_engine
+from app.cache import cached
 
 register_adapter(np.int64, AsIs)
 register_adapter(np.float64, AsIs)
 
-# Connect metadata with engine, to reflect tables on DataBase
-metadata.reflect(bind=engine)
-
-# Message to send when functions end
-message_to_return = {
-    'status':'',
-    'status_code': 102,
-    'affected_rows': 0,
-    'operation': '',
-    'message': '',
-    'data': ''
+# Both business queries read the quarterly aggregates by default ('aggregates') or can be
+# computed from hired_employees ('raw'). Statements are built once with bound parameters,
+# and the raw ones filter with half-open datetime ranges so the datetime index can be used
+# (and only the partition of the year is read when hired_employees is partitioned).
+# Result column types are declared so rows can be streamed with a known schema.
+employees_hired_by_q_columns = {
+    'department_name': String,
+    'job_name': String,
+    'q1': BigInteger,
+    'q2': BigInteger,
+    'q3': BigInteger,
+    'q4': BigInteger
 }
 
-def employees_hired_q_2021(year: int) -> str:
-    """
-    Retrieves the number of employees hired for each job and department in the selected year,
-    divided by quarters, and returns the result as a JSON string.
-
-    Args:
-        year (int): The year for which the data is requested.
-
-    Returns:
-        str: A JSON string representing the number of employees hired, divided by quarter.
-    """
+total_employees_by_department_columns = {
+    'department_id': Integer,
+    'department_name': String,
+    'hired': BigInteger
+}
 
-    sql = f"""
+employees_hired_by_q_stmts = {
+    'aggregates': text("""
+    SELECT 
+        d.department AS department_name,
+        j.job AS job_name,
+        SUM(CASE WHEN q.quarter = 1 THEN q.hired ELSE 0 END) AS Q1,
+        SUM(CASE WHEN q.quarter = 2 THEN q.hired ELSE 0 END) AS Q2,
+        SUM(CASE WHEN q.quarter = 3 THEN q.hired ELSE 0 END) AS Q3,
+        SUM(CASE WHEN q.quarter = 4 THEN q.hired ELSE 0 END) AS Q4
+    FROM
+        hired_employees_quarterly q
+    JOIN
+        departments d
+        ON q.department_id = d.id
+    JOIN
+        jobs j
+        ON q.job_id = j.id
+    WHERE
+        q.year = :year
+    GROUP BY
+        d.department,
+        j.job
+    ORDER BY
+        d.department,
+        j.job
+    """).columns(**employees_hired_by_q_columns),
+    'raw': text("""
     SELECT 
         d.department AS department_name,
         j.job AS job_name,
-        SUM(CASE WHEN DATE_PART('quarter', h.datetime::timestamp) = 1 THEN 1 ELSE 0 END) AS Q1,
-        SUM(CASE WHEN DATE_PART('quarter', h.datetime::timestamp) = 2 THEN 1 ELSE 0 END) AS Q2,
-        SUM(CASE WHEN DATE_PART('quarter', h.datetime::timestamp) = 3 THEN 1 ELSE 0 END) AS Q3,
-        SUM(CASE WHEN DATE_PART('quarter', h.datetime::timestamp) = 4 THEN 1 ELSE 0 END) AS Q4
+        SUM(CASE WHEN DATE_PART('quarter', h.datetime) = 1 THEN 1 ELSE 0 END) AS Q1,
+        SUM(CASE WHEN DATE_PART('quarter', h.datetime) = 2 THEN 1 ELSE 0 END) AS Q2,
+        SUM(CASE WHEN DATE_PART('quarter', h.datetime) = 3 THEN 1 ELSE 0 END) AS Q3,
+        SUM(CASE WHEN DATE_PART('quarter', h.datetime) = 4 THEN 1 ELSE 0 END) AS Q4
     FROM
         hired_employees h
     JOIN
@@ -53,39 +75,35 @@ def employees_hired_q_2021(year: int) -> str:
         jobs j
         ON h.job_id = j.id
     WHERE
-        DATE_PART('year', h.datetime::timestamp) = {year}
+        h.datetime >= :start
+        AND h.datetime < :end
     GROUP BY
         d.department,
         j.job
     ORDER BY
         d.department,
         j.job
-    """
-    
-    with engine.begin() as conn:
-        df = pd.read_sql(sql, conn)
-        conn.close()
-
-    result = df.to_json()
-    
-    return result
-
-
-def total_employees_by_department(year:int) -> str:
-    """
-    Retrieves list of ids, name and number of employees hired of each department that hired more employees
-    than the mean of employees hired in selected year for all the departments, and returns
-    the result as a JSON string.
-
-    Args:
-        year (int): The year for which the data is requested.
-
-    Returns:
-        str: A JSON string representing the number of employees hired, divided by quarter.
-    """
+    """).columns(**employees_hired_by_q_columns)
+}
 
-    sql = f"""
-    WITH department_hires AS (
+department_hires_sql = {
+    'aggregates': """
+        SELECT 
+            d.id AS department_id,
+            d.department AS department_name,
+            SUM(q.hired) AS hired
+        FROM
+            hired_employees_quarterly q
+        JOIN
+            departments d
+            ON q.department_id = d.id
+        WHERE
+            q.year = :year
+        GROUP BY
+            d.id,
+            d.department
+    """,
+    'raw': """
         SELECT 
             d.id AS department_id,
             d.department AS department_name,
@@ -96,10 +114,18 @@ def total_employees_by_department(year:int) -> str:
             departments d
             ON h.department_id = d.id
         WHERE
-            DATE_PART('year', h.datetime::timestamp) = {year}
+            h.datetime >= :start
+            AND h.datetime < :end
         GROUP BY
             d.id,
             d.department
+    """
+}
+
+total_employees_by_department_stmts = {
+    source: text(f"""
+    WITH department_hires AS (
+        {sql}
     ),
     average_hires AS (
         SELECT
@@ -118,11 +144,70 @@ def total_employees_by_department(year:int) -> str:
         ON dh.hired > ah.mean_hires
     ORDER BY
         dh.hired DESC
+    """).columns(**total_employees_by_department_columns)
+    for source, sql in department_hires_sql.items()
+}
+
+
+def year_params(year: int, source: str) -> dict:
+    """
+    Bound parameters to filter one year: the year itself for the aggregates, or its
+    half-open [start, end) datetime range for hired_employees.
+
+    Args:
+        year (int): The year to filter.
+        source (str): 'aggregates' or 'raw'.
+
+    Returns:
+        dict: Parameters for the statement of the source.
+    """
+    if source == 'raw':
+        return {'start': datetime(year, 1, 1), 'end': datetime(year + 1, 1, 1)}
+
+    return {'year': year}
+
+
+@cached(tables=('hired_employees', 'departments', 'jobs'))
+def employees_hired_q_2021(year: int, source: str = 'aggregates') -> str:
+    """
+    Retrieves the number of employees hired for each job and department in the selected year,
+    divided by quarters, and returns the result as a JSON string.
+
+    Args:
+        year (int): The year for which the data is requested.
+        source (str): Read the quarterly aggregates ('aggregates') or hired_employees ('raw').
+
+    Returns:
+        str: A JSON string representing the number of employees hired, divided by quarter.
+    """
+    stmt = employees_hired_by_q_stmts[source]
+    
+    with read_engine.begin() as conn:
+        df = pd.read_sql(stmt, conn, params=year_params(year, source))
+
+    result = df.to_json()
+    
+    return result
+
+
+@cached(tables=('hired_employees', 'departments'))
+def total_employees_by_department(year:int, source: str = 'aggregates') -> str:
+    """
+    Retrieves list of ids, name and number of employees hired of each department that hired more employees
+    than the mean of employees hired in selected year for all the departments, and returns
+    the result as a JSON string.
+
+    Args:
+        year (int): The year for which the data is requested.
+        source (str): Read the quarterly aggregates ('aggregates') or hired_employees ('raw').
+
+    Returns:
+        str: A JSON string representing the number of employees hired, divided by quarter.
     """
+    stmt = total_employees_by_department_stmts[source]
     
-    with engine.begin() as conn:
-        df = pd.read_sql(sql, conn)
-        conn.close()
+    with read_engine.begin() as conn:
+        df = pd.read_sql(stmt, conn, params=year_params(year, source))
 
     result = df.to_json()
     
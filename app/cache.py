@@ -0,0 +1,90 @@
+from collections import OrderedDict
+import functools
+import threading
+import time
+
+from app.config import CACHE_MAX_ENTRIES, CACHE_TTL_SECONDS
+
+# Write version of every table, bumped after each committed write
+table_versions = {}
+
+# Cached results by key, least recently used first, bounded to CACHE_MAX_ENTRIES
+cache_entries = OrderedDict()
+cache_lock = threading.Lock()
+
+
+def current_versions(tables: tuple[str]) -> tuple[int]:
+    return tuple(table_versions.get(table_name, 0) for table_name in tables)
+
+
+def bump_version(table_name: str):
+    """
+    Mark a table as changed, dropping every cached result that depends on it.
+
+    Args:
+        table_name (str): Name of the written table.
+    """
+    with cache_lock:
+        table_versions[table_name] = table_versions.get(table_name, 0) + 1
+
+        stale_keys = [
+            key for key, entry in cache_entries.items()
+            if table_name in entry['tables']
+        ]
+        for key in stale_keys:
+            del cache_entries[key]
+
+
+def clear_cache():
+    with cache_lock:
+        cache_entries.clear()
+
+
+def cached(tables: tuple[str], ttl: float = CACHE_TTL_SECONDS):
+    """
+    Cache the results of a function by its arguments, until the TTL expires or a table it reads is written.
+
+    Args:
+        tables (tuple[str]): Names of the tables the function reads.
+        ttl (float): Seconds a result is served from the cache.
+
+    Returns:
+        callable: Decorator for the function.
+    """
+    tables = tuple(tables)
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key = (func.__module__, func.__qualname__, args, tuple(sorted(kwargs.items())))
+            now = time.monotonic()
+
+            with cache_lock:
+                versions = current_versions(tables)
+                entry = cache_entries.get(key)
+
+                if entry and entry['expires_at'] > now and entry['versions'] == versions:
+                    cache_entries.move_to_end(key)
+                    return entry['value']
+
+            value = func(*args, **kwargs)
+
+            with cache_lock:
+                # Results computed while a write happened are not stored
+                if current_versions(tables) == versions:
+                    cache_entries[key] = {
+                        'tables': tables,
+                        'versions': versions,
+                        'expires_at': now + ttl,
+                        'value': value
+                    }
+                    cache_entries.move_to_end(key)
+
+                    while len(cache_entries) > CACHE_MAX_ENTRIES:
+                        cache_entries.popitem(last=False)
+
+            return value
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,95 @@
+from sqlalchemy import Table, select, text
+import threading
+
+from app.config import engine
+from app.models import metadata, catalog_tables
+
+# Schema and catalog registry: tables are reflected and catalog_tables is read once,
+# then served from memory until invalidate_catalog is called
+catalog_lock = threading.Lock()
+catalog_loaded = False
+
+# Table name of every file name registered in catalog_tables
+catalog_file_names = {}
+
+# Tables of the schema, without partitions nor the partitions detached from hired_employees,
+# which are only reachable through their parent table
+catalog_relations_stmt = text("""
+    SELECT c.relname
+    FROM pg_class c
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    WHERE n.nspname = current_schema()
+        AND c.relkind IN ('r', 'p')
+        AND NOT c.relispartition
+        AND c.relname !~ '^hired_employees_[0-9]{4}_detached_[0-9]+$'
+""")
+
+
+def load_catalog():
+    """Reflect the DB tables and read catalog_tables, unless they are already loaded."""
+    global catalog_loaded
+    if catalog_loaded:
+        return
+
+    with catalog_lock:
+        if catalog_loaded:
+            return
+
+        with engine.begin() as conn:
+            table_names = conn.execute(catalog_relations_stmt).scalars().all()
+            rows = conn.execute(
+                select(catalog_tables.c.file_name, catalog_tables.c.table_name)
+            ).all()
+
+        metadata.reflect(bind=engine, only=table_names)
+
+        catalog_file_names.clear()
+        catalog_file_names.update(dict(rows))
+        catalog_loaded = True
+
+
+def invalidate_catalog():
+    """Force the next lookup to reload the schema and the catalog, e.g. after DDL or catalog changes."""
+    global catalog_loaded
+    with catalog_lock:
+        catalog_loaded = False
+
+
+def get_table(table_name: str) -> Table | None:
+    """
+    Get a table by name from the registry.
+
+    Args:
+        table_name (str): Name of the table.
+
+    Returns:
+        Table | None: SQLAlchemy Table object, None when it does not exist.
+    """
+    load_catalog()
+
+    return metadata.tables.get(table_name)
+
+
+def resolve_table(name: str) -> Table | None:
+    """
+    Get a table by its name or by a file name registered in catalog_tables.
+
+    Args:
+        name (str): Table name or file name without extension.
+
+    Returns:
+        Table | None: SQLAlchemy Table object, None when the name is unknown.
+    """
+    load_catalog()
+
+    table = metadata.tables.get(name)
+    if table is None and name in catalog_file_names:
+        table = metadata.tables.get(catalog_file_names[name])
+
+    return table
+
+
+def list_tables() -> list[str]:
+    load_catalog()
+
+    return list(metadata.tables.keys())
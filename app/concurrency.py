@@ -0,0 +1,25 @@
+import functools
+import anyio.to_thread
+
+from app.config import DB_THREADPOOL_SIZE
+
+# Caps the threads doing blocking DB work, created on first use inside the event loop
+db_limiter = None
+
+
+async def run_db(func, *args, **kwargs):
+    """
+    Run a blocking DB function in a worker thread, so it does not stall the event loop.
+
+    Args:
+        func (callable): Synchronous function to run.
+        *args, **kwargs: Arguments for the function.
+
+    Returns:
+        Any: Value returned by the function.
+    """
+    global db_limiter
+    if db_limiter is None:
+        db_limiter = anyio.CapacityLimiter(DB_THREADPOOL_SIZE)
+
+    return await anyio.to_thread.run_sync(functools.partial(func, *args, **kwargs), limiter=db_limiter)
@@ -1,27 +1,219 @@
-from sqlalchemy import create_engine, MetaData, insert, delete
+from sqlalchemy import create_engine, MetaData, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.orm import sessionmaker, declarative_base
-from sqlalchemy.engine import URL
+from sqlalchemy.engine import URL, make_url
+from sqlalchemy.pool import QueuePool
+from sqlalchemy import exc
+from dotenv import load_dotenv
+import threading
+import time
+import os
 
-DATABASE = 'globant_challenge'
+# Settings are read from environment variables (or a .env file), defaults fit docker-compose.yml
+load_dotenv()
 
 
-DATABASE_URL = URL.create(
+def env_int(name: str, default: int) -> int:
+    return int(os.getenv(name, default))
+
+
+def env_float(name: str, default: float) -> float:
+    return float(os.getenv(name, default))
+
+
+def env_bool(name: str, default: bool) -> bool:
+    return os.getenv(name, str(default)).strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+DATABASE = os.getenv('DB_NAME', 'globant_challenge')
+
+# Rows read per chunk when CSV files are ingested in streaming mode
+CSV_CHUNKSIZE = env_int('CSV_CHUNKSIZE', 100000)
+
+# Available strategies to load new records: executemany INSERT or PostgreSQL COPY
+LOAD_METHODS = ('insert', 'copy')
+
+# Bytes kept in memory by the COPY buffer before spilling it to disk
+COPY_BUFFER_SIZE = env_int('COPY_BUFFER_SIZE', 64 * 1024 * 1024)
+
+# Processes parsing files in parallel in multi-file uploads
+PARSE_WORKERS = env_int('PARSE_WORKERS', os.cpu_count() or 1)
+
+# Background ingestion: concurrent jobs and finished jobs kept for status queries
+INGEST_WORKERS = env_int('INGEST_WORKERS', 2)
+JOBS_HISTORY_SIZE = env_int('JOBS_HISTORY_SIZE', 100)
+
+# Query result cache: max entries (LRU) and seconds an entry lives.
+# The TTL also bounds staleness for writes made by other worker processes.
+CACHE_MAX_ENTRIES = env_int('CACHE_MAX_ENTRIES', 256)
+CACHE_TTL_SECONDS = env_float('CACHE_TTL_SECONDS', 300)
+
+# Rows fetched from the DB cursor and encoded per batch in streamed responses
+STREAM_BATCH_ROWS = env_int('STREAM_BATCH_ROWS', 10000)
+
+# JSON batch ingest: max rows per request, and requests are coalesced into one
+# transaction per table until the flush window ends or the pending rows reach the limit
+BATCH_MAX_ROWS = env_int('BATCH_MAX_ROWS', 1000)
+BATCH_FLUSH_SECONDS = env_float('BATCH_FLUSH_SECONDS', 0.05)
+BATCH_FLUSH_ROWS = env_int('BATCH_FLUSH_ROWS', 10000)
+
+# Rejected rows of uploads are written to reject files in this folder. References between
+# tables (column.info['references']) are checked against the stored keys when enabled
+REJECTS_DIR = os.getenv('REJECTS_DIR', './rejects/')
+VALIDATE_REFERENCES = env_bool('VALIDATE_REFERENCES', True)
+
+# Create hired_employees range partitioned by datetime year (only when the table does not exist yet)
+PARTITION_HIRED_EMPLOYEES = env_bool('PARTITION_HIRED_EMPLOYEES', False)
+
+# Bulk reads: max keys per lookup request and rows per keyset page
+LOOKUP_MAX_KEYS = env_int('LOOKUP_MAX_KEYS', 100000)
+SCAN_MAX_ROWS = env_int('SCAN_MAX_ROWS', 10000)
+
+
+# Writes go to DATABASE_URL. Analytics and lookups go to READ_DATABASE_URL (e.g. a replica),
+# which defaults to the same database
+DATABASE_URL = make_url(os.getenv('DATABASE_URL')) if os.getenv('DATABASE_URL') else URL.create(
     drivername='postgresql'
-    , username='globant'
-    , password='globant'
-    , host='localhost'
+    , username=os.getenv('DB_USER', 'globant')
+    , password=os.getenv('DB_PASSWORD', 'globant')
+    , host=os.getenv('DB_HOST', 'localhost')
     , database=DATABASE
-    , port=5432
+    , port=env_int('DB_PORT', 5432)
 )
+READ_DATABASE_URL = make_url(os.getenv('READ_DATABASE_URL')) if os.getenv('READ_DATABASE_URL') else DATABASE_URL
+
+# Connection pool sizing, API calls to the DB run in a threadpool with as many threads as connections
+DB_POOL_SIZE = env_int('DB_POOL_SIZE', 10)
+DB_MAX_OVERFLOW = env_int('DB_MAX_OVERFLOW', 10)
+DB_POOL_TIMEOUT = env_float('DB_POOL_TIMEOUT', 30)
+DB_POOL_RECYCLE = env_int('DB_POOL_RECYCLE', 1800)
+DB_POOL_PRE_PING = env_bool('DB_POOL_PRE_PING', True)
+DB_THREADPOOL_SIZE = DB_POOL_SIZE + DB_MAX_OVERFLOW
+
+# Server side statement timeouts in milliseconds, 0 disables them
+DB_STATEMENT_TIMEOUT_MS = env_int('DB_STATEMENT_TIMEOUT_MS', 0)
+DB_READ_STATEMENT_TIMEOUT_MS = env_int('DB_READ_STATEMENT_TIMEOUT_MS', DB_STATEMENT_TIMEOUT_MS)
+
+# psycopg2 executemany: 'values_only' or 'values_plus_batch', and rows per round trip
+DB_EXECUTEMANY_MODE = os.getenv('DB_EXECUTEMANY_MODE', 'values_plus_batch')
+DB_INSERTMANYVALUES_PAGE_SIZE = env_int('DB_INSERTMANYVALUES_PAGE_SIZE', 1000)
+DB_EXECUTEMANY_BATCH_PAGE_SIZE = env_int('DB_EXECUTEMANY_BATCH_PAGE_SIZE', 100)
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how many checkouts waited for a connection and for how long."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats_lock = threading.Lock()
+        self.wait_stats = {
+            'checkouts': 0,
+            'timeouts': 0,
+            'wait_seconds_total': 0.0,
+            'wait_seconds_max': 0.0
+        }
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+
+        except exc.TimeoutError:
+            with self.stats_lock:
+                self.wait_stats['timeouts'] += 1
+            raise
+
+        finally:
+            waited = time.perf_counter() - start
+            with self.stats_lock:
+                self.wait_stats['checkouts'] += 1
+                self.wait_stats['wait_seconds_total'] += waited
+                self.wait_stats['wait_seconds_max'] = max(self.wait_stats['wait_seconds_max'], waited)
+
+
+def build_engine(url: URL, statement_timeout_ms: int):
+    """
+    Create an engine with the pool and driver settings of the environment.
+
+    Args:
+        url (URL): Database URL.
+        statement_timeout_ms (int): Server side statement timeout, 0 to disable it.
+
+    Returns:
+        Engine: SQLAlchemy engine.
+    """
+    connect_args = {}
+    if statement_timeout_ms:
+        connect_args['options'] = f'-c statement_timeout={statement_timeout_ms}'
+
+    return create_engine(
+        url
+        , poolclass=TimedQueuePool
+        , pool_size=DB_POOL_SIZE
+        , max_overflow=DB_MAX_OVERFLOW
+        , pool_timeout=DB_POOL_TIMEOUT
+        , pool_recycle=DB_POOL_RECYCLE
+        , pool_pre_ping=DB_POOL_PRE_PING
+        , executemany_mode=DB_EXECUTEMANY_MODE
+        , insertmanyvalues_page_size=DB_INSERTMANYVALUES_PAGE_SIZE
+        , executemany_batch_page_size=DB_EXECUTEMANY_BATCH_PAGE_SIZE
+        , connect_args=connect_args
+    )
+
+
+engine = build_engine(DATABASE_URL, DB_STATEMENT_TIMEOUT_MS)
+
+# Same engine when there is no separate read database
+read_engine = engine
+if READ_DATABASE_URL != DATABASE_URL or DB_READ_STATEMENT_TIMEOUT_MS != DB_STATEMENT_TIMEOUT_MS:
+    read_engine = build_engine(READ_DATABASE_URL, DB_READ_STATEMENT_TIMEOUT_MS)
+
+
+def pool_metrics() -> dict:
+    """
+    Saturation and wait time of the connection pools.
+
+    Returns:
+        dict: Stats of the 'write' pool, and of the 'read' pool when it is a separate engine.
+    """
+    engines = {'write': engine}
+    if read_engine is not engine:
+        engines['read'] = read_engine
+
+    metrics = {}
+    for name, db_engine in engines.items():
+        pool = db_engine.pool
+        with pool.stats_lock:
+            wait_stats = dict(pool.wait_stats)
+
+        metrics[name] = {
+            'size': pool.size(),
+            'max_overflow': DB_MAX_OVERFLOW,
+            'checked_out': pool.checkedout(),
+            'checked_in': pool.checkedin(),
+            'overflow': pool.overflow(),
+            'saturation': pool.checkedout() / (DB_POOL_SIZE + DB_MAX_OVERFLOW),
+            **wait_stats
+        }
+
+    return metrics
+
 
-engine = create_engine(DATABASE_URL)
 metadata = MetaData()
 
 Session = sessionmaker(bind=engine)
 
-def init_db():
-    metadata.create_all(engine, checkfirst=True)
+def init_db() -> bool:
+    """
+    Create the missing tables and indexes and seed catalog_tables, in one transaction.
+    With PARTITION_HIRED_EMPLOYEES, a new hired_employees is created partitioned by year.
 
+    The catalog is seeded with a single upsert that only writes rows that changed,
+    so running it again on an initialized DB writes nothing.
+
+    Returns:
+        bool: True when the catalog changed.
+    """
     data_catalog = [
         [1, 'departments', 'departments__1___1_'],
         [2, 'jobs', 'jobs'],
@@ -30,19 +222,31 @@ def init_db():
 
     table = metadata.tables['catalog_tables']
 
-    for data in data_catalog:
-        stmt_delete = delete(table).where(
-            table.columns.id.in_([data[0]])
-        )
-        
-        stmt_insert = insert(table).values(
-            id=data[0],
-            table_name=data[1],
-            file_name=data[2]
+    stmt = pg_insert(table).values([
+        {'id': data[0], 'table_name': data[1], 'file_name': data[2]}
+        for data in data_catalog
+    ])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.id],
+        set_={'table_name': stmt.excluded.table_name, 'file_name': stmt.excluded.file_name},
+        where=tuple_(table.c.table_name, table.c.file_name).is_distinct_from(
+            tuple_(stmt.excluded.table_name, stmt.excluded.file_name)
         )
+    )
+
+    with engine.begin() as conn:
+        # Partitioned tables are created by hand, create_all then skips them
+        if PARTITION_HIRED_EMPLOYEES:
+            from app.partitions import create_partitioned_tables
+            create_partitioned_tables(conn)
+
+        metadata.create_all(conn, checkfirst=True)
+
+        # create_all skips tables that already exist, add indexes declared after their creation
+        for table_to_index in metadata.sorted_tables:
+            for index in table_to_index.indexes:
+                index.create(conn, checkfirst=True)
+
+        result = conn.execute(stmt)
 
-        
-        with engine.connect() as conn:
-            conn.execute(stmt_delete)
-            conn.execute(stmt_insert)
-            conn.commit()
+    return result.rowcount > 0
@@ -0,0 +1,164 @@
+from sqlalchemy import Table, text
+import pandas as pd
+import numpy as np
+from typing import BinaryIO
+import hashlib
+
+from app.config import engine
+
+# Delta uploads keep a 64 bit hash of every loaded row (row_fingerprints) and the digest of
+# the last file fully loaded per table (file_digests). Any other write to a table forgets the
+# fingerprints of the keys it touches and the file digest, so they never hide a change.
+
+select_fingerprints_stmt = text("""
+    SELECT key_hash, row_hash
+    FROM row_fingerprints
+    WHERE table_name = :table_name AND key_hash = ANY(CAST(:key_hashes AS BIGINT[]))
+""")
+
+save_fingerprints_stmt = text("""
+    INSERT INTO row_fingerprints (table_name, key_hash, row_hash)
+    SELECT :table_name, key_hash, row_hash
+    FROM UNNEST(CAST(:key_hashes AS BIGINT[]), CAST(:row_hashes AS BIGINT[])) AS f (key_hash, row_hash)
+    ON CONFLICT (table_name, key_hash) DO UPDATE SET row_hash = EXCLUDED.row_hash
+    WHERE row_fingerprints.row_hash <> EXCLUDED.row_hash
+""")
+
+has_fingerprints_stmt = text("""
+    SELECT EXISTS (SELECT 1 FROM row_fingerprints WHERE table_name = :table_name)
+""")
+
+forget_fingerprints_stmt = text("""
+    DELETE FROM row_fingerprints
+    WHERE table_name = :table_name AND key_hash = ANY(CAST(:key_hashes AS BIGINT[]))
+""")
+
+forget_table_fingerprints_stmt = text("""
+    DELETE FROM row_fingerprints WHERE table_name = :table_name
+""")
+
+forget_file_digest_stmt = text("""
+    DELETE FROM file_digests WHERE table_name = :table_name
+""")
+
+save_file_digest_stmt = text("""
+    INSERT INTO file_digests (table_name, digest, rows, loaded_at)
+    VALUES (:table_name, :digest, :rows, NOW())
+    ON CONFLICT (table_name) DO UPDATE
+    SET digest = EXCLUDED.digest, rows = EXCLUDED.rows, loaded_at = EXCLUDED.loaded_at
+""")
+
+
+def hash_rows(df: pd.DataFrame, columns: list[str]) -> np.ndarray:
+    """Vectorized 64 bit hash of the given columns of every row, as signed integers for BIGINT."""
+    return pd.util.hash_pandas_object(df[columns], index=False).to_numpy().view(np.int64)
+
+
+def file_digest(source: str | BinaryIO) -> str:
+    """SHA-256 of a file path or binary stream, read in blocks. Streams are rewound for the parser."""
+    if isinstance(source, str):
+        with open(source, 'rb') as file:
+            return file_digest(file)
+
+    digest = hashlib.sha256()
+    source.seek(0)
+    while block := source.read(1024 * 1024):
+        digest.update(block)
+    source.seek(0)
+
+    return digest.hexdigest()
+
+
+def last_file_digest(table_name: str) -> str | None:
+    with engine.begin() as conn:
+        return conn.execute(
+            text('SELECT digest FROM file_digests WHERE table_name = :table_name'),
+            {'table_name': table_name}
+        ).scalar()
+
+
+def save_file_digest(table_name: str, digest: str, rows: int):
+    """Record a file as the last one fully loaded into a table."""
+    with engine.begin() as conn:
+        conn.execute(save_file_digest_stmt, {'table_name': table_name, 'digest': digest, 'rows': rows})
+
+
+def changed_rows(conn, table: Table, df: pd.DataFrame, id_columns: list[str]) -> tuple[pd.Series, np.ndarray, np.ndarray]:
+    """
+    Compare the rows of a schema aligned DataFrame with their stored fingerprints.
+
+    Args:
+        conn (Connection): Open SQLAlchemy connection.
+        table (Table): SQLAlchemy Table object.
+        df (pd.DataFrame): Rows to load, one per key.
+        id_columns (list[str]): List of columns representing the primary key.
+
+    Returns:
+        tuple[pd.Series, np.ndarray, np.ndarray]: Mask of the new or changed rows, and the
+            key and row hashes of every row.
+    """
+    key_hashes = hash_rows(df, id_columns)
+    row_hashes = hash_rows(df, [col for col in table.columns.keys() if col in df.columns])
+
+    stored = conn.execute(
+        select_fingerprints_stmt, {'table_name': table.name, 'key_hashes': key_hashes.tolist()}
+    ).all()
+
+    changed = np.ones(len(df), dtype=bool)
+    if stored:
+        stored_keys, stored_rows = (np.array(values, dtype=np.int64) for values in zip(*stored))
+        positions = pd.Index(stored_keys).get_indexer(key_hashes)
+        found = positions >= 0
+        changed[found] = stored_rows[positions[found]] != row_hashes[found]
+
+    return pd.Series(changed, index=df.index), key_hashes, row_hashes
+
+
+def save_fingerprints(conn, table_name: str, key_hashes: np.ndarray, row_hashes: np.ndarray):
+    """
+    Store the fingerprints of rows loaded in delta mode, in the transaction of the load. The file
+    digest of the table is dropped until the whole file is loaded and save_file_digest is called.
+
+    Args:
+        conn (Connection): Open SQLAlchemy connection with the write transaction.
+        table_name (str): Name of the written table.
+        key_hashes (np.ndarray): Key hashes of the loaded rows.
+        row_hashes (np.ndarray): Row hashes of the loaded rows.
+    """
+    conn.execute(forget_file_digest_stmt, {'table_name': table_name})
+
+    if len(key_hashes):
+        conn.execute(save_fingerprints_stmt, {
+            'table_name': table_name,
+            'key_hashes': key_hashes.tolist(),
+            'row_hashes': row_hashes.tolist()
+        })
+
+
+def forget_fingerprints(conn, table_name: str, df: pd.DataFrame, id_columns: list[str]):
+    """
+    Drop the fingerprints of the written keys and the file digest of a table. Run it in the
+    transaction of every write that is not a delta load.
+
+    Args:
+        conn (Connection): Open SQLAlchemy connection with the write transaction.
+        table_name (str): Name of the written table.
+        df (pd.DataFrame): Schema aligned rows (or keys) written.
+        id_columns (list[str]): List of columns representing the primary key.
+    """
+    conn.execute(forget_file_digest_stmt, {'table_name': table_name})
+
+    # Tables never loaded in delta mode have no fingerprints, skip hashing their keys
+    if df.empty or not conn.execute(has_fingerprints_stmt, {'table_name': table_name}).scalar():
+        return
+
+    conn.execute(forget_fingerprints_stmt, {
+        'table_name': table_name,
+        'key_hashes': hash_rows(df, id_columns).tolist()
+    })
+
+
+def forget_table_fingerprints(conn, table_name: str):
+    """Drop every fingerprint and the file digest of a table, e.g. when rows leave it in bulk."""
+    conn.execute(forget_file_digest_stmt, {'table_name': table_name})
+    conn.execute(forget_table_fingerprints_stmt, {'table_name': table_name})
@@ -0,0 +1,257 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import pandas as pd
+import multiprocessing
+import zipfile
+import time
+import os
+
+from app.models import metadata
+from app.config import PARSE_WORKERS
+from app.utils import df_to_schema, csv_options, get_table_from_file, update_records
+from app.validation import validate_frame, new_reject_id, write_rejects
+from app.results import OperationResult
+from app.fingerprints import file_digest, last_file_digest, save_file_digest
+
+# Process pool parsing and coercing files, created on first use
+parse_executor = None
+
+
+def get_parse_executor() -> ProcessPoolExecutor:
+    global parse_executor
+    if parse_executor is None:
+        # Not fork: the pool starts from a worker thread while other threads may hold locks
+        # (metrics, cache, connection pool) that a forked child would keep locked forever.
+        # forkserver does not exist on Windows, which only spawns
+        start_method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+        parse_executor = ProcessPoolExecutor(
+            max_workers=PARSE_WORKERS, mp_context=multiprocessing.get_context(start_method)
+        )
+
+    return parse_executor
+
+
+def referenced_tables(table_name: str) -> set[str]:
+    """Names of the tables referenced by the columns of a table (column.info['references'])."""
+    table = metadata.tables[table_name]
+
+    return {
+        column.info['references'] for column in table.columns
+        if 'references' in column.info
+    }
+
+
+def load_levels(table_names: set[str]) -> list[list[str]]:
+    """
+    Group tables in load levels: every table goes after the tables it references, and
+    tables in the same level do not depend on each other.
+
+    Args:
+        table_names (set[str]): Names of the tables to load.
+
+    Returns:
+        list[list[str]]: Levels of table names, in load order.
+    """
+    pending = {
+        table_name: referenced_tables(table_name) & table_names
+        for table_name in table_names
+    }
+    levels = []
+
+    while pending:
+        level = sorted(table_name for table_name, refs in pending.items() if not refs)
+        if not level:
+            raise ValueError(f'Circular references between tables {sorted(pending)}')
+
+        levels.append(level)
+        for table_name in level:
+            del pending[table_name]
+        for refs in pending.values():
+            refs.difference_update(level)
+
+    return levels
+
+
+def extract_files(file_paths: list[str]) -> list[str]:
+    """
+    Replace the zip files of a list by the CSV files they contain. Every member is extracted
+    into its own numbered folder next to its zip: names resolve the tables, so they are kept,
+    and members with the same name as other members or uploaded files never overwrite them.
+
+    Args:
+        file_paths (list[str]): Paths of CSV or zip files.
+
+    Returns:
+        list[str]: Paths of CSV files.
+    """
+    csv_paths = []
+    for file_path in file_paths:
+        if not zipfile.is_zipfile(file_path):
+            csv_paths.append(file_path)
+            continue
+
+        with zipfile.ZipFile(file_path) as archive:
+            for index, member in enumerate(archive.infolist()):
+                if member.is_dir() or not member.filename.lower().endswith('.csv'):
+                    continue
+
+                member_dir = os.path.join(os.path.dirname(file_path), f'member_{index}')
+                os.makedirs(member_dir, exist_ok=True)
+                member_path = os.path.join(member_dir, os.path.basename(member.filename))
+                with archive.open(member) as source, open(member_path, 'wb') as target:
+                    while block := source.read(1024 * 1024):
+                        target.write(block)
+
+                csv_paths.append(member_path)
+
+    return csv_paths
+
+
+def parse_file(file_path: str, table_name: str) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Read a CSV, align it with its table schema and split out the rows with invalid values.
+    Runs in the parse process pool, references are checked later by update_records.
+
+    Args:
+        file_path (str): Path to the file.
+        table_name (str): Name of the destination table.
+
+    Returns:
+        tuple[pd.DataFrame, pd.DataFrame]: Converted valid rows and rejected rows.
+    """
+    table = metadata.tables[table_name]
+    df = pd.read_csv(file_path, **csv_options(table))
+
+    return validate_frame(df, df_to_schema(df, table), table, check_references=False)
+
+
+def file_report(file_path: str, table_name: str, rows: int, result: OperationResult) -> dict:
+    return {
+        'file': os.path.basename(file_path),
+        'table_name': table_name,
+        'rows': rows,
+        **result.to_dict()
+    }
+
+
+def load_table(table_name: str, parsed: list, id_columns: list[str], method: str, delta: bool = False) -> list[dict]:
+    """
+    Wait for the parsed files of a table and upsert them one after the other.
+
+    Args:
+        table_name (str): Name of the table.
+        parsed (list): Tuples of (file path, file digest, future with the parsed DataFrame).
+        id_columns (list[str]): List of columns representing the primary key.
+        method (str): Load strategy, 'insert' (executemany) or 'copy' (PostgreSQL COPY).
+        delta (bool): Skip unchanged rows and record the digest of fully loaded files.
+
+    Returns:
+        list[dict]: Report of every file.
+    """
+    reports = []
+    for file_path, digest, future in parsed:
+        rows = 0
+        try:
+            if future is None:
+                result = OperationResult('update', data={'unchanged_file': True})
+                result.message = f'File unchanged since its last load into {table_name}.'
+                result.succeed()
+                reports.append(file_report(file_path, table_name, rows, result))
+                continue
+
+            df, rejects = future.result()
+            rows = df.shape[0] + rejects.shape[0]
+
+            reject_id = None
+            if not rejects.empty:
+                reject_id = new_reject_id(table_name)
+                write_rejects(rejects, metadata.tables[table_name], reject_id)
+
+            result = update_records(table_name, df, id_columns, method, reject_id, delta=delta)
+            result.rejected += rejects.shape[0]
+
+            if delta and result.ok and not result.rejected:
+                save_file_digest(table_name, digest, rows)
+            # Release the frames before waiting for the next file
+            del df, rejects
+
+        except Exception as e:
+            result = OperationResult('update', message=str(e))
+
+        reports.append(file_report(file_path, table_name, rows, result))
+
+    return reports
+
+
+def ingest_files(file_paths: list[str], id_columns: list[str], method: str = 'insert', delta: bool = False) -> OperationResult:
+    """
+    Ingest several CSV (or zip) files at once: all of them are parsed in parallel in a process
+    pool, and loaded in reference order, dimension tables first and independent tables concurrently.
+
+    Args:
+        file_paths (list[str]): Paths of the files, file names resolve the tables. Zip members
+            are extracted next to their zip.
+        id_columns (list[str]): List of columns representing the primary key.
+        method (str): Load strategy, 'insert' (executemany) or 'copy' (PostgreSQL COPY).
+        delta (bool): Skip files equal to the last one fully loaded into their table, and
+            unchanged rows of the others.
+
+    Returns:
+        OperationResult: Overall result, with the report of every file in data.
+    """
+    start = time.perf_counter()
+    csv_paths = extract_files(file_paths)
+
+    files_by_table = {}
+    reports = []
+    for file_path in csv_paths:
+        try:
+            table_name = get_table_from_file(file_path).name
+            files_by_table.setdefault(table_name, []).append(file_path)
+
+        except Exception as e:
+            reports.append(file_report(file_path, '', 0, OperationResult('update', message=str(e))))
+
+    executor = get_parse_executor()
+    parsed = {}
+    for table_name, paths in files_by_table.items():
+        last_digest = last_file_digest(table_name) if delta else None
+        parsed[table_name] = []
+        for file_path in paths:
+            digest = file_digest(file_path) if delta else None
+            if delta and digest == last_digest:
+                # Same content as the last file fully loaded, nothing to parse
+                parsed[table_name].append((file_path, digest, None))
+            else:
+                parsed[table_name].append((file_path, digest, executor.submit(parse_file, file_path, table_name)))
+
+    levels = load_levels(set(parsed))
+    with ThreadPoolExecutor(max_workers=max([len(level) for level in levels], default=1)) as loaders:
+        for level in levels:
+            futures = [
+                loaders.submit(load_table, table_name, parsed[table_name], id_columns, method, delta)
+                for table_name in level
+            ]
+            for future in futures:
+                reports.extend(future.result())
+
+    result = OperationResult('ingest_files')
+    for report in reports:
+        result.affected_rows += report['affected_rows']
+        result.inserted += report['inserted']
+        result.updated += report['updated']
+        result.skipped += report['skipped']
+        result.rejected += report['rejected']
+
+    failed = [report for report in reports if report['status_code'] != 200]
+    if failed:
+        result.message = f'{len(failed)} of {len(reports)} files failed.'
+    else:
+        result.succeed()
+
+    result.data = {
+        'load_order': levels,
+        'seconds': time.perf_counter() - start,
+        'files': reports
+    }
+
+    return result
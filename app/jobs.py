@@ -0,0 +1,148 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import threading
+import time
+import uuid
+import os
+
+from app.config import INGEST_WORKERS, JOBS_HISTORY_SIZE, CSV_CHUNKSIZE
+from app.utils import ingest_csv
+
+# Bounded pool running the parse -> coerce -> load pipeline out of the request handlers
+executor = ThreadPoolExecutor(max_workers=INGEST_WORKERS, thread_name_prefix='ingest')
+
+# Registry of ingestion jobs by id, in submission order
+jobs = {}
+jobs_lock = threading.Lock()
+
+
+def job_snapshot(job: dict) -> dict:
+    """Copy a job so callers never read it while a worker is updating it."""
+    return {**job, 'errors': list(job['errors'])}
+
+
+def prune_jobs():
+    """Drop the oldest finished jobs once the history is over its size. Call holding jobs_lock."""
+    finished = [
+        job_id for job_id, job in jobs.items()
+        if job['status'] in ('success', 'failure')
+    ]
+
+    for job_id in finished[:max(len(finished) - JOBS_HISTORY_SIZE, 0)]:
+        del jobs[job_id]
+
+
+def update_job(job_id: str, **values):
+    with jobs_lock:
+        jobs[job_id].update(values)
+
+
+def run_job(
+    job_id: str,
+    file_path: str,
+    id_columns: list[str],
+    chunksize: int,
+    method: str,
+    delta: bool = False,
+    file_name: str | None = None
+):
+    """
+    Run the ingestion of a file and keep its job updated with progress and result.
+
+    Args:
+        job_id (str): Id of the job.
+        file_path (str): Path to the file.
+        id_columns (list[str]): List of columns representing the primary key.
+        chunksize (int): Number of rows per chunk.
+        method (str): Load strategy for new records, 'insert' (executemany) or 'copy' (PostgreSQL COPY).
+        delta (bool): Skip an unchanged file and unchanged rows, see ingest_csv.
+        file_name (str, optional): Name of the uploaded file, resolves the table.
+    """
+    start = time.perf_counter()
+    update_job(job_id, status='running', started_at=datetime.now().isoformat())
+
+    def progress(table_name: str, rows_processed: int, chunks: int):
+        elapsed = time.perf_counter() - start
+        update_job(
+            job_id,
+            table_name=table_name,
+            rows_processed=rows_processed,
+            chunks=chunks,
+            rows_per_second=rows_processed / elapsed if elapsed else 0.0
+        )
+
+    try:
+        result = ingest_csv(file_path, id_columns, chunksize, method, progress, delta, file_name).to_dict()
+        status = result['status']
+        errors = [result['message']] if result['status_code'] != 200 else []
+
+    except Exception as e:
+        result = None
+        status = 'failure'
+        errors = [str(e)]
+
+    with jobs_lock:
+        job = jobs[job_id]
+        job['status'] = status
+        job['finished_at'] = datetime.now().isoformat()
+        job['errors'].extend(errors)
+        job['result'] = result
+        prune_jobs()
+
+
+def submit_job(
+    file_path: str,
+    id_columns: list[str],
+    chunksize: int = CSV_CHUNKSIZE,
+    method: str = 'insert',
+    delta: bool = False,
+    file_name: str | None = None
+) -> dict:
+    """
+    Queue the ingestion of a file in the worker pool.
+
+    Args:
+        file_path (str): Path to the file.
+        id_columns (list[str]): List of columns representing the primary key.
+        chunksize (int): Number of rows per chunk.
+        method (str): Load strategy for new records, 'insert' (executemany) or 'copy' (PostgreSQL COPY).
+        delta (bool): Skip an unchanged file and unchanged rows, see ingest_csv.
+        file_name (str, optional): Name of the uploaded file when the path is a temporary name.
+
+    Returns:
+        dict: Snapshot of the queued job.
+    """
+    job_id = uuid.uuid4().hex
+    job = {
+        'job_id': job_id,
+        'status': 'queued',
+        'file_name': os.path.basename(file_name or file_path),
+        'table_name': '',
+        'rows_processed': 0,
+        'chunks': 0,
+        'rows_per_second': 0.0,
+        'created_at': datetime.now().isoformat(),
+        'started_at': None,
+        'finished_at': None,
+        'errors': [],
+        'result': None
+    }
+
+    with jobs_lock:
+        jobs[job_id] = job
+        snapshot = job_snapshot(job)
+
+    executor.submit(run_job, job_id, file_path, id_columns, chunksize, method, delta, file_name)
+
+    return snapshot
+
+
+def get_job(job_id: str) -> dict | None:
+    with jobs_lock:
+        job = jobs.get(job_id)
+        return job_snapshot(job) if job else None
+
+
+def list_jobs() -> list[dict]:
+    with jobs_lock:
+        return [job_snapshot(job) for job in jobs.values()]
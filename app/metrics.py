@@ -0,0 +1,239 @@
+from fastapi import FastAPI, Request, Response
+from starlette.routing import Match
+from contextlib import contextmanager
+from contextvars import ContextVar
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+import threading
+import time
+
+from app.config import env_bool, pool_metrics
+
+# Add a Server-Timing header with the stage and DB timings of every response
+METRICS_SERVER_TIMING = env_bool('METRICS_SERVER_TIMING', False)
+
+# Histogram buckets in seconds, from single queries to whole file loads
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+INF_BUCKET = 'le="+Inf"'
+
+# Route template of the request being served, work outside requests (jobs) is 'background'
+current_endpoint = ContextVar('current_endpoint', default='background')
+
+# Stage timings of the request being served, only collected for the Server-Timing header
+request_timings = ContextVar('request_timings', default=None)
+
+metrics_lock = threading.Lock()
+
+# Histograms by label values: [bucket counts, count, sum]
+stage_seconds = {}
+db_query_seconds = {}
+http_request_seconds = {}
+
+# Counters by label values
+stage_rows = {}
+stage_last_rows_per_second = {}
+
+
+def observe(histogram: dict, labels: tuple, seconds: float):
+    """Add one observation to a histogram. Call it holding metrics_lock."""
+    series = histogram.setdefault(labels, [[0] * len(BUCKETS), 0, 0.0])
+    for i, bound in enumerate(BUCKETS):
+        if seconds <= bound:
+            series[0][i] += 1
+    series[1] += 1
+    series[2] += seconds
+
+
+def record_timing(name: str, seconds: float):
+    """Add seconds to the Server-Timing entry of the current request, if any."""
+    timings = request_timings.get()
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + seconds
+
+
+def observe_stage(stage: str, seconds: float, rows: int | None = None):
+    """
+    Record the duration of a processing stage and, optionally, the rows it handled.
+
+    Args:
+        stage (str): Name of the stage, e.g. 'read_csv' or 'upsert'.
+        seconds (float): Duration of the stage.
+        rows (int, optional): Rows processed by the stage.
+    """
+    labels = (current_endpoint.get(), stage)
+    with metrics_lock:
+        observe(stage_seconds, labels, seconds)
+        if rows is not None:
+            stage_rows[labels] = stage_rows.get(labels, 0) + rows
+            if seconds > 0:
+                stage_last_rows_per_second[labels] = rows / seconds
+
+    record_timing(stage, seconds)
+
+
+@contextmanager
+def timed(stage: str, rows: int | None = None):
+    """
+    Time the block as a processing stage.
+
+    Yields:
+        dict: Set 'rows' in it when the row count is only known inside the block.
+    """
+    info = {'rows': rows}
+    start = time.perf_counter()
+    try:
+        yield info
+    finally:
+        observe_stage(stage, time.perf_counter() - start, info['rows'])
+
+
+def observe_query(seconds: float):
+    """Record one DB round trip of the current endpoint."""
+    with metrics_lock:
+        observe(db_query_seconds, (current_endpoint.get(),), seconds)
+
+    record_timing('db', seconds)
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    observe_query(time.perf_counter() - conn.info['query_start'].pop())
+
+
+@event.listens_for(Engine, 'handle_error')
+def handle_error(exception_context):
+    # Failed statements never reach after_cursor_execute
+    conn = exception_context.connection
+    if conn is not None and conn.info.get('query_start'):
+        observe_query(time.perf_counter() - conn.info['query_start'].pop())
+
+
+def observe_request(endpoint: str, method: str, status_code: int, seconds: float):
+    with metrics_lock:
+        observe(http_request_seconds, (endpoint, method, str(status_code)), seconds)
+
+
+def server_timing(timings: dict) -> str:
+    """Format stage timings as a Server-Timing header value, durations in milliseconds."""
+    return ', '.join(f'{name};dur={seconds * 1000:.1f}' for name, seconds in timings.items())
+
+
+def escape_label(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(names: tuple, values: tuple, extra: str = '') -> str:
+    pairs = [f'{name}="{escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def format_histogram(name: str, help_text: str, label_names: tuple, histogram: dict) -> list[str]:
+    lines = [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+    for labels, (buckets, count, total) in sorted(histogram.items()):
+        for bound, bucket_count in zip(BUCKETS, buckets):
+            le = f'le="{bound}"'
+            lines.append(f'{name}_bucket{format_labels(label_names, labels, le)} {bucket_count}')
+        lines.append(f'{name}_bucket{format_labels(label_names, labels, INF_BUCKET)} {count}')
+        lines.append(f'{name}_count{format_labels(label_names, labels)} {count}')
+        lines.append(f'{name}_sum{format_labels(label_names, labels)} {total}')
+
+    return lines
+
+
+def format_series(name: str, help_text: str, kind: str, label_names: tuple, series: dict) -> list[str]:
+    lines = [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+    for labels, value in sorted(series.items()):
+        lines.append(f'{name}{format_labels(label_names, labels)} {value}')
+
+    return lines
+
+
+def render_metrics() -> str:
+    """
+    Render every metric in the Prometheus text exposition format.
+
+    Returns:
+        str: Metrics page served at /metrics.
+    """
+    with metrics_lock:
+        lines = [
+            *format_histogram(
+                'api_request_duration_seconds', 'HTTP request latency.',
+                ('endpoint', 'method', 'status'), http_request_seconds
+            ),
+            *format_histogram(
+                'api_stage_duration_seconds', 'Duration of processing stages (read_csv, df_to_schema, upsert...).',
+                ('endpoint', 'stage'), stage_seconds
+            ),
+            *format_series(
+                'api_stage_rows_total', 'Rows processed by stage.',
+                'counter', ('endpoint', 'stage'), stage_rows
+            ),
+            *format_series(
+                'api_stage_last_rows_per_second', 'Throughput of the last run of a stage.',
+                'gauge', ('endpoint', 'stage'), stage_last_rows_per_second
+            ),
+            *format_histogram(
+                'api_db_query_duration_seconds', 'Latency of DB round trips, the count is the number of round trips.',
+                ('endpoint',), db_query_seconds
+            )
+        ]
+
+    pools = pool_metrics()
+    for metric in ('checked_out', 'overflow', 'saturation', 'checkouts', 'timeouts', 'wait_seconds_total'):
+        kind = 'counter' if metric in ('checkouts', 'timeouts', 'wait_seconds_total') else 'gauge'
+        lines.extend(format_series(
+            f'api_db_pool_{metric}', f'Connection pool {metric.replace("_", " ")}.',
+            kind, ('pool',), {(name,): stats[metric] for name, stats in pools.items()}
+        ))
+
+    return '\n'.join(lines) + '\n'
+
+
+
+def route_template(app: FastAPI, request: Request) -> str:
+    """Path template of the route matching a request, so ids do not create new label values."""
+    for route in app.router.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return route.path
+
+    return 'unmatched'
+
+
+def init_metrics(app: FastAPI):
+    @app.middleware('http')
+    async def instrument_request(request: Request, call_next):
+        endpoint = route_template(app, request)
+        endpoint_token = current_endpoint.set(endpoint)
+        timings_token = request_timings.set({} if METRICS_SERVER_TIMING else None)
+        start = time.perf_counter()
+        status_code = 500
+        try:
+            response = await call_next(request)
+            status_code = response.status_code
+
+            timings = request_timings.get()
+            if timings is not None:
+                timings['total'] = time.perf_counter() - start
+                response.headers['Server-Timing'] = server_timing(timings)
+
+            return response
+
+        finally:
+            observe_request(endpoint, request.method, status_code, time.perf_counter() - start)
+            request_timings.reset(timings_token)
+            current_endpoint.reset(endpoint_token)
+
+
+    @app.get('/metrics', include_in_schema=False)
+    async def metrics():
+        return Response(render_metrics(), media_type='text/plain; version=0.0.4')
@@ -1,4 +1,4 @@
-from sqlalchemy import Table, Column, Integer, String, DateTime
+from sqlalchemy import Table, Column, Integer, BigInteger, String, DateTime, UniqueConstraint, Index
 from app.config import metadata
 
 catalog_tables = Table(
@@ -20,11 +20,49 @@ jobs = Table(
     Column('job', String, nullable=False)
 )
 
+# Created partitioned by datetime year with PARTITION_HIRED_EMPLOYEES (app.partitions), the id
+# is then indexed but not a primary key in the database
 hired_employees = Table(
     'hired_employees', metadata,
     Column('id', Integer, primary_key=True),
     Column('name', String, nullable=True),
     Column('datetime', DateTime, nullable=True),
+    # Logical references (no FK constraint in the DB), used to order loads and validate rows
+    Column('department_id', Integer, nullable=True, info={'references': 'departments'}),
+    Column('job_id', Integer, nullable=True, info={'references': 'jobs'}),
+    # Support the year range filters and the department/job joins of the business queries
+    Index('ix_hired_employees_datetime', 'datetime'),
+    Index('ix_hired_employees_department_id_job_id', 'department_id', 'job_id')
+)
+
+# Hire counts per (year, quarter, department, job), maintained incrementally on hired_employees writes
+hired_employees_quarterly = Table(
+    'hired_employees_quarterly', metadata,
+    Column('year', Integer, nullable=False),
+    Column('quarter', Integer, nullable=False),
     Column('department_id', Integer, nullable=True),
-    Column('job_id', Integer, nullable=True)
+    Column('job_id', Integer, nullable=True),
+    Column('hired', Integer, nullable=False),
+    UniqueConstraint(
+        'year', 'quarter', 'department_id', 'job_id',
+        name='uq_hired_employees_quarterly',
+        postgresql_nulls_not_distinct=True
+    )
+)
+
+# Content hash of every row loaded with delta uploads, by table and hash of the row key
+row_fingerprints = Table(
+    'row_fingerprints', metadata,
+    Column('table_name', String, primary_key=True),
+    Column('key_hash', BigInteger, primary_key=True),
+    Column('row_hash', BigInteger, nullable=False)
+)
+
+# Digest of the last file fully loaded into each table with a delta upload
+file_digests = Table(
+    'file_digests', metadata,
+    Column('table_name', String, primary_key=True),
+    Column('digest', String, nullable=False),
+    Column('rows', Integer, nullable=False),
+    Column('loaded_at', DateTime, nullable=False)
 )
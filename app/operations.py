@@ -1,68 +1,268 @@
-from fastapi import FastAPI, UploadFile, HTTPException, Query
+from fastapi import FastAPI, UploadFile, HTTPException, Query, Request
+from fastapi.responses import FileResponse
+from typing import Literal
+import anyio.to_thread
+import importlib.util
+import tempfile
+import sys
 import json
+import shutil
 import os
 
-from app.config import metadata
-from app.config import engine
-from app.utils import process_csv, update_records, select_records
-from app.business import employees_hired_q_2021, total_employees_by_department
+from app.config import CSV_CHUNKSIZE, SCAN_MAX_ROWS, pool_metrics
+from app.concurrency import run_db
+from app.catalog import list_tables, invalidate_catalog
+from app.streaming import negotiate_format, stream_query
+from app.schemas import BatchInsert, BulkLookup, BulkDelete
+from app.aggregates import check_quarterly_aggregates
+from app.metrics import timed
+
+
+def lazy_import(name: str):
+    """
+    Import a module lazily: it is executed on its first attribute access, so heavy
+    dependencies (pandas, numpy) are loaded by the first request instead of at startup.
+
+    Args:
+        name (str): Full name of the module.
+
+    Returns:
+        module: The module, loaded on first use.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+
+    spec = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+
+    return module
+
+
+# Modules that pull pandas/numpy
+utils = lazy_import('app.utils')
+business = lazy_import('app.business')
+jobs = lazy_import('app.jobs')
+ingest = lazy_import('app.ingest')
+batching = lazy_import('app.batching')
+validation = lazy_import('app.validation')
+fingerprints = lazy_import('app.fingerprints')
+partitions = lazy_import('app.partitions')
+
+
+def save_upload(file: UploadFile, file_path: str):
+    with timed('upload_write'), open(file_path, "wb") as buffer:
+        # Copy in bounded blocks instead of loading the whole upload in memory
+        shutil.copyfileobj(file.file, buffer, 1024 * 1024)
+
+
+def spill_upload(file: UploadFile) -> str:
+    """
+    Save an upload that must outlive its request (background jobs) under a unique name,
+    so concurrent uploads of the same file name never overwrite each other.
+
+    Returns:
+        str: Path of the spilled file, the job removes it once read.
+    """
+    os.makedirs('./tmp_data/', exist_ok=True)
+    fd, file_path = tempfile.mkstemp(dir='./tmp_data/', suffix='.csv')
+    os.close(fd)
+    save_upload(file, file_path)
+
+    return file_path
+
+
+async def lookup_records(table_name: str, id_columns: list[str], ids: list, request: Request):
+    try:
+        # Stream rows as NDJSON/Arrow/Parquet when the client asks for it
+        file_format = negotiate_format(request.headers.get('accept'))
+        if file_format:
+            stmt = await run_db(utils.select_records_stmt, table_name, id_columns, ids)
+            return stream_query(stmt, None, file_format)
+
+        return await run_db(utils.select_records, table_name, id_columns, ids)
+
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 
 def init_operations(app: FastAPI):
     @app.get('/get_tables/')
-    async def available_tables():
-        # Por implementar lectura de tablas disponibles
-        metadata.reflect(bind=engine)
-        tables = list(metadata.tables.keys())
+    async def available_tables(refresh: bool = Query(default=False)):
+        # Tables come from the in-memory registry, refresh=true reloads it after DDL changes
+        if refresh:
+            invalidate_catalog()
+
+        tables = await run_db(list_tables)
         return json.dumps({'tables_names': tables})
 
 
     @app.get('/get_info/{table_name}/{id_columns}/{id}')
-    async def get_info(table_name: str, id_columns: str, id: str):
-        # TODO: implementar manejo para poder pasar listas como input
-        result = select_records(table_name, id_columns, id)
+    async def get_info(table_name: str, id_columns: str, id: str, request: Request):
+        # Several ids can be requested at once separated by commas, e.g. /get_info/jobs/id/1,2,3
+        return await lookup_records(table_name, [id_columns], id.split(','), request)
 
-        return result
 
+    @app.post('/get_info/{table_name}')
+    async def get_info_bulk(table_name: str, lookup: BulkLookup, request: Request):
+        ids = [tuple(key) if isinstance(key, list) else key for key in lookup.ids]
+        return await lookup_records(table_name, lookup.id_columns, ids, request)
 
-    @app.post('/upload_csv/')
-    async def upload_csv(file: UploadFile):
+
+    @app.get('/scan/{table_name}')
+    async def scan(
+        table_name: str,
+        cursor: str | None = Query(default=None),
+        limit: int = Query(default=1000, gt=0, le=SCAN_MAX_ROWS)
+    ):
         try:
-            os.makedirs('./tmp_data/', exist_ok=True)
-            file_path = f'./tmp_data/{file.filename}'
-            with open(file_path, "wb") as buffer:
-                buffer.write(await file.read())
+            return await run_db(utils.scan_records, table_name, cursor, limit)
+
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
 
-            # background_tasks.add_task(process_csv, file_path)
+    @app.post('/upload_csv/')
+    async def upload_csv(
+        file: UploadFile,
+        chunksize: int | None = Query(default=None, gt=0),
+        load_method: Literal['insert', 'copy'] = Query(default='insert'),
+        background: bool = Query(default=True),
+        delta: bool = Query(default=False)
+    ):
+        # delta=true skips the file when it is the last one loaded, and unchanged rows by fingerprint
+        try:
             print(f'File {file.filename} uploaded.')
 
+            if background:
+                file_path = await anyio.to_thread.run_sync(spill_upload, file)
+                job = jobs.submit_job(
+                    file_path=file_path, id_columns=['id'], chunksize=chunksize or CSV_CHUNKSIZE, method=load_method,
+                    delta=delta, file_name=file.filename
+                )
+                print(f'File {file.filename} queued as job {job["job_id"]}.')
+
+                return json.dumps(job)
+
+            # Requests served in place parse the spooled upload directly, without a copy to disk
+            if chunksize:
+                print(f'File {file.filename} streaming ingestion started.')
+                result = await run_db(
+                    utils.ingest_csv, file.file, id_columns=['id'], chunksize=chunksize, method=load_method,
+                    delta=delta, file_name=file.filename
+                )
+
+                if result.ok:
+                    return json.dumps(result.to_dict())
+
+                else:
+                    raise Exception(result.message)
+
             print(f'File {file.filename} processing started.')
-            result = process_csv(file_path=file_path)
+            result = await run_db(utils.process_csv, file.file, delta=delta, file_name=file.filename)
             
-            if result['status_code'] == 200:
-                # TODO  Debo poner un return acá, la API devolverá como mensaje el dict que ponga
-                # TODO  Dejarlo igual que el resto de funciones de utils.py
-                df = result['data']['dataframe']
-                table_name = result['data']['table_name']
+            if result.ok:
+                if result.frame is None:
+                    # Same file as the last delta load
+                    return json.dumps(result.to_dict())
+
+                df = result.frame
+                table_name = result.data['table_name']
+                digest = result.data['digest']
+                rejected = result.rejected
 
                 print(f'File {file.filename} inserting started.')
-                result = update_records(table_name, df, id_columns=['id'])
+                result = await run_db(
+                    utils.update_records, table_name, df, id_columns=['id'], method=load_method,
+                    reject_id=result.reject_id, delta=delta
+                )
+                result.rejected += rejected
 
-                return json.dumps(result)
-                # return str(result)
-                # print({"message": f"File {file.filename} uploaded and processing started."})
+                if delta and result.ok and result.rejected == 0:
+                    await run_db(fingerprints.save_file_digest, table_name, digest, df.shape[0])
+
+                return json.dumps(result.to_dict())
 
             else:
-                raise Exception(result)
+                raise Exception(result.message)
 
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Error uploading file: {str(e)}")
         
 
+    @app.post('/upload_csv_batch/')
+    async def upload_csv_batch(
+        files: list[UploadFile],
+        load_method: Literal['insert', 'copy'] = Query(default='insert'),
+        delta: bool = Query(default=False)
+    ):
+        # CSV or zip files, parsed in parallel and loaded in table reference order
+        os.makedirs('./tmp_data/', exist_ok=True)
+        upload_dir = tempfile.mkdtemp(dir='./tmp_data/')
+        try:
+            file_paths = []
+            for index, file in enumerate(files):
+                # One folder per file keeps the names (they resolve the tables) without overwrites
+                file_dir = os.path.join(upload_dir, str(index))
+                os.makedirs(file_dir)
+                file_path = os.path.join(file_dir, os.path.basename(file.filename))
+                await anyio.to_thread.run_sync(save_upload, file, file_path)
+                file_paths.append(file_path)
+
+            result = await run_db(ingest.ingest_files, file_paths, ['id'], load_method, delta)
+
+            return json.dumps(result.to_dict(), default=str)
+
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Error uploading files: {str(e)}")
+
+        finally:
+            shutil.rmtree(upload_dir, ignore_errors=True)
+
+
+    @app.get('/jobs')
+    async def ingestion_jobs():
+        return jobs.list_jobs()
+
+
+    @app.get('/jobs/{job_id}')
+    async def ingestion_job(job_id: str):
+        job = jobs.get_job(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+
+        return job
+
+
+    @app.get('/rejects/{reject_id}')
+    async def download_rejects(reject_id: str):
+        # Rejected rows of an upload, in upload format plus reason columns. Named after the
+        # table, so the fixed file can be uploaded again as it is
+        path = validation.reject_path(reject_id)
+        if path is None:
+            raise HTTPException(status_code=404, detail=f"Reject file {reject_id} not found")
+
+        table_name = validation.REJECT_ID_PATTERN.fullmatch(reject_id)['table_name']
+        return FileResponse(path, media_type='text/csv', filename=f'{table_name}.csv')
+
+
+    @app.get('/pool_status')
+    async def pool_status():
+        # Connection pool usage and checkout waits of the write and read engines
+        return pool_metrics()
+
+
     @app.post('/batch_insert/')
-    async def batch_insert(request: dict):
-        # Por implementar insertado en batch
-        return pass_func
+    async def batch_insert(batch: BatchInsert):
+        result = await batching.submit_batch(batch.table_name, batch.records)
+
+        if not result.ok:
+            raise HTTPException(status_code=500, detail=f"Error inserting batch: {result.message}")
+
+        return json.dumps(result.to_dict())
 
 
     @app.put('/update/{table_name}/{id}')
@@ -73,8 +273,40 @@ def init_operations(app: FastAPI):
 
     @app.delete('/delete/{table_name}/{id}')
     async def delete_record(table_name: str, id: str):
-        # Por implementar el delete
-        return pass_func
+        # Several ids can be deleted at once separated by commas, e.g. /delete/jobs/1,2,3
+        result = await run_db(utils.delete_keys, table_name, ['id'], id.split(','))
+
+        if not result.ok:
+            raise HTTPException(status_code=500, detail=f"Error deleting records: {result.message}")
+
+        return json.dumps(result.to_dict())
+
+
+    @app.post('/delete/{table_name}')
+    async def delete_records_bulk(table_name: str, keys: BulkDelete):
+        ids = [tuple(key) if isinstance(key, list) else key for key in keys.ids]
+        result = await run_db(utils.delete_keys, table_name, keys.id_columns, ids)
+
+        if not result.ok:
+            raise HTTPException(status_code=500, detail=f"Error deleting records: {result.message}")
+
+        return json.dumps(result.to_dict())
+
+
+    @app.post('/delete_csv/{table_name}')
+    async def delete_records_csv(
+        table_name: str,
+        file: UploadFile,
+        id_columns: str = Query(default='id'),
+        chunksize: int = Query(default=CSV_CHUNKSIZE, gt=0)
+    ):
+        # CSV without header, one key per line, columns given comma separated in id_columns
+        result = await run_db(utils.delete_csv, file.file, table_name, id_columns.split(','), chunksize)
+
+        if not result.ok:
+            raise HTTPException(status_code=500, detail=f"Error deleting records: {result.message}")
+
+        return json.dumps(result.to_dict())
     
     """
     ------------------
@@ -85,10 +317,21 @@ def init_operations(app: FastAPI):
 
     desc_temp = 'Number of employees hired for each job and department in selected year divided by quarter.'
     @app.get('/business/employees_hired_by_q', description=desc_temp)
-    async def employees_hired_by_q(year: int = Query(default=2021)):
+    async def employees_hired_by_q(
+        request: Request,
+        year: int = Query(default=2021),
+        source: Literal['aggregates', 'raw'] = Query(default='aggregates')
+    ):
         try:
-            result = employees_hired_q_2021(year)
+            file_format = negotiate_format(request.headers.get('accept'))
+            if file_format:
+                return stream_query(business.employees_hired_by_q_stmts[source], business.year_params(year, source), file_format)
+
+            result = await run_db(business.employees_hired_q_2021, year, source)
             return result
+
+        except HTTPException:
+            raise
         
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Error getting records: {str(e)}")
@@ -96,14 +339,51 @@ def init_operations(app: FastAPI):
 
     desc_temp = 'List of ids, name and number of employees hired of each department that hired more employees than the mean of employees hired in selected year for all the departments'
     @app.get('/business/total_employees_by_department', description=desc_temp)
-    async def employees_by_department(year: int = Query(default=2021)):
+    async def employees_by_department(
+        request: Request,
+        year: int = Query(default=2021),
+        source: Literal['aggregates', 'raw'] = Query(default='aggregates')
+    ):
         try:
-            result = total_employees_by_department(year)
+            file_format = negotiate_format(request.headers.get('accept'))
+            if file_format:
+                return stream_query(business.total_employees_by_department_stmts[source], business.year_params(year, source), file_format)
+
+            result = await run_db(business.total_employees_by_department, year, source)
             return result
+
+        except HTTPException:
+            raise
         
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Error getting records: {str(e)}")
 
+
+    desc_temp = 'Compare the quarterly hiring aggregates with the raw hired_employees table, optionally rebuilding them.'
+    @app.get('/business/quarterly_aggregates/check', description=desc_temp)
+    async def quarterly_aggregates_check(repair: bool = Query(default=False)):
+        try:
+            result = await run_db(check_quarterly_aggregates, repair)
+            return result
+        
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Error checking aggregates: {str(e)}")
+
+
+    @app.get('/partitions/hired_employees')
+    async def hired_employees_partitions():
+        return await run_db(partitions.list_partitions, 'hired_employees')
+
+
+    @app.post('/partitions/hired_employees/{year}/detach')
+    async def detach_hired_employees_partition(year: int, drop: bool = Query(default=False)):
+        # Old years leave hired_employees without moving rows, drop=true also deletes them
+        try:
+            return await run_db(partitions.detach_partition, year, drop)
+
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
     
 
 pass_func = 'Not implemented yet.'
\ No newline at end of file
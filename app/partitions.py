@@ -0,0 +1,241 @@
+from sqlalchemy import Table, text
+import pandas as pd
+from datetime import datetime
+import re
+
+from app.config import engine
+from app.cache import bump_version
+from app.fingerprints import forget_table_fingerprints
+
+# hired_employees can be range partitioned by datetime year (PARTITION_HIRED_EMPLOYEES), so year
+# scoped queries only read one partition and old years can be detached. Rows with a null datetime
+# go to the default partition. A unique key of a partitioned table must include the partition
+# column, so ids are kept unique by the writes (see merge_statement in app.utils) instead.
+PARTITIONED_TABLES = ('hired_employees',)
+
+create_hired_employees_stmt = text("""
+    CREATE TABLE IF NOT EXISTS hired_employees (
+        id INTEGER NOT NULL,
+        name VARCHAR,
+        datetime TIMESTAMP WITHOUT TIME ZONE,
+        department_id INTEGER,
+        job_id INTEGER
+    ) PARTITION BY RANGE (datetime)
+""")
+
+create_default_partition_stmt = text("""
+    CREATE TABLE IF NOT EXISTS hired_employees_default PARTITION OF hired_employees DEFAULT
+""")
+
+# Replaces the primary key index, one index per partition
+create_id_index_stmt = text("""
+    CREATE INDEX IF NOT EXISTS ix_hired_employees_id ON hired_employees (id)
+""")
+
+table_exists_stmt = text("""
+    SELECT to_regclass(:table_name) IS NOT NULL
+""")
+
+relkind_stmt = text("""
+    SELECT relkind FROM pg_class WHERE oid = to_regclass(:table_name)
+""")
+
+partitions_stmt = text("""
+    SELECT c.relname
+    FROM pg_inherits i
+    JOIN pg_class c ON c.oid = i.inhrelid
+    WHERE i.inhparent = to_regclass(:table_name)
+""")
+
+# Serialize the writers of a table: key lookups and inserts of partitioned tables, and the
+# quarterly aggregate deltas of hired_employees, must not interleave
+lock_stmt = text("""
+    SELECT pg_advisory_xact_lock(hashtext(:key))
+""")
+
+# Writes hold the partitions lock shared, so no partition is detached while they run;
+# partition DDL (ensure_partitions, detach_partition) holds it exclusive
+lock_shared_stmt = text("""
+    SELECT pg_advisory_xact_lock_shared(hashtext(:key))
+""")
+
+# Whether each table is partitioned in the database, a table never changes kind
+partitioned = {}
+
+
+def partition_name(table_name: str, year: int) -> str:
+    return f'{table_name}_{int(year)}'
+
+
+def create_partitioned_tables(conn):
+    """
+    Create hired_employees as a partitioned table with its default partition, before
+    metadata.create_all, which then skips it. An existing plain table is not converted.
+
+    Args:
+        conn (Connection): Open SQLAlchemy connection with the init_db transaction.
+
+    Raises:
+        ValueError: hired_employees already exists as a plain table.
+    """
+    relkind = conn.execute(relkind_stmt, {'table_name': 'hired_employees'}).scalar()
+    if relkind not in (None, 'p'):
+        message = (
+            'hired_employees already exists as a plain table and can not be partitioned, '
+            'unset PARTITION_HIRED_EMPLOYEES or migrate the table.'
+        )
+        raise ValueError(message)
+
+    conn.execute(create_hired_employees_stmt)
+    conn.execute(create_default_partition_stmt)
+    conn.execute(create_id_index_stmt)
+
+
+def is_partitioned(table_name: str) -> bool:
+    """Whether a table is partitioned in the database, checked once per process."""
+    if table_name not in PARTITIONED_TABLES:
+        return False
+
+    if table_name not in partitioned:
+        with engine.begin() as conn:
+            relkind = conn.execute(relkind_stmt, {'table_name': table_name}).scalar()
+        partitioned[table_name] = relkind == 'p'
+
+    return partitioned[table_name]
+
+
+def partition_years(conn, table_name: str) -> set[int]:
+    """Years with a partition in the database."""
+    pattern = re.compile(rf'{table_name}_(\d{{4}})')
+    names = conn.execute(partitions_stmt, {'table_name': table_name}).scalars().all()
+
+    return {int(match[1]) for match in map(pattern.fullmatch, names) if match}
+
+
+def row_years(df: pd.DataFrame) -> set[int]:
+    """Years of the dated rows, the partitions they go to."""
+    return set(df['datetime'].dropna().dt.year.unique().tolist())
+
+
+def ensure_partitions(table: Table, df: pd.DataFrame):
+    """
+    Create the missing year partitions of the rows to write, so no dated row ends in the
+    default partition (a year partition can not be created while the default one holds
+    rows of that year). Runs in its own transaction before the write, the existing
+    partitions are read from the database every time since other workers detach them.
+
+    Args:
+        table (Table): SQLAlchemy Table object.
+        df (pd.DataFrame): Schema aligned rows to write.
+    """
+    if df.empty or not is_partitioned(table.name):
+        return
+
+    years = row_years(df)
+    if not years:
+        return
+
+    with engine.begin() as conn:
+        if years <= partition_years(conn, table.name):
+            return
+
+        conn.execute(lock_stmt, {'key': f'partitions:{table.name}'})
+        existing = partition_years(conn, table.name)
+
+        for year in sorted(years - existing):
+            name = partition_name(table.name, year)
+            if conn.execute(table_exists_stmt, {'table_name': name}).scalar():
+                message = f'Can not create the {year} partition of {table.name}, table {name} already exists.'
+                raise ValueError(message)
+
+            conn.execute(text(f"""
+                CREATE TABLE {name} PARTITION OF {table.name}
+                FOR VALUES FROM ('{year}-01-01') TO ('{year + 1}-01-01')
+            """))
+
+
+def hold_partitions(conn, table: Table, df: pd.DataFrame):
+    """
+    Keep the partitions of the rows to write until the write transaction ends, and check
+    none was detached since ensure_partitions, so no dated row goes to the default partition.
+
+    Args:
+        conn (Connection): Open SQLAlchemy connection with the write transaction.
+        table (Table): SQLAlchemy Table object.
+        df (pd.DataFrame): Schema aligned rows to write.
+    """
+    if df.empty or not is_partitioned(table.name):
+        return
+
+    conn.execute(lock_shared_stmt, {'key': f'partitions:{table.name}'})
+
+    missing = row_years(df) - partition_years(conn, table.name)
+    if missing:
+        message = f'Partitions of {table.name} for {sorted(missing)} were detached during the write, retry it.'
+        raise ValueError(message)
+
+
+def lock_keys(conn, table_name: str):
+    """Hold the writer lock of a table until the transaction ends."""
+    conn.execute(lock_stmt, {'key': f'keys:{table_name}'})
+
+
+def list_partitions(table_name: str = 'hired_employees') -> dict:
+    """
+    Year partitions of a table.
+
+    Args:
+        table_name (str): Name of the partitioned table.
+
+    Returns:
+        dict: Whether the table is partitioned and the years of its partitions.
+    """
+    if not is_partitioned(table_name):
+        return {'table_name': table_name, 'partitioned': False, 'years': []}
+
+    with engine.begin() as conn:
+        years = partition_years(conn, table_name)
+
+    return {'table_name': table_name, 'partitioned': True, 'years': sorted(years)}
+
+
+def detach_partition(year: int, drop: bool = False) -> dict:
+    """
+    Detach the hired_employees partition of a year, a catalog change that does not move
+    rows. Its rows leave the quarterly aggregates, and the fingerprints of the table are
+    forgotten so a delta upload loads them again. A kept partition is renamed with a
+    detached suffix, so new rows of the year get a new partition.
+
+    Args:
+        year (int): Year of the partition.
+        drop (bool): Drop the detached partition instead of keeping it as a plain table.
+
+    Returns:
+        dict: Name of the detached table (None when dropped) and whether it was dropped.
+    """
+    table_name = 'hired_employees'
+    if not is_partitioned(table_name):
+        message = f'Table {table_name} is not partitioned.'
+        raise ValueError(message)
+
+    name = partition_name(table_name, year)
+    with engine.begin() as conn:
+        conn.execute(lock_stmt, {'key': f'partitions:{table_name}'})
+        if year not in partition_years(conn, table_name):
+            message = f'Table {table_name} has no partition for {year}.'
+            raise ValueError(message)
+
+        conn.execute(text(f'ALTER TABLE {table_name} DETACH PARTITION {name}'))
+        conn.execute(text('DELETE FROM hired_employees_quarterly WHERE year = :year'), {'year': year})
+        forget_table_fingerprints(conn, table_name)
+
+        detached = None
+        if drop:
+            conn.execute(text(f'DROP TABLE {name}'))
+        else:
+            detached = f'{name}_detached_{datetime.now():%Y%m%d%H%M%S}'
+            conn.execute(text(f'ALTER TABLE {name} RENAME TO {detached}'))
+
+    bump_version(table_name)
+
+    return {'table_name': table_name, 'partition': name, 'detached_table': detached, 'dropped': drop}
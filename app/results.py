@@ -0,0 +1,66 @@
+from dataclasses import dataclass, field
+from typing import Any
+
+
+@dataclass(slots=True)
+class OperationResult:
+    """
+    Result of one call to a data operation, created per call so concurrent calls never share it.
+
+    Attributes:
+        operation (str): Name of the operation.
+        status (str): 'success' or 'failure'.
+        status_code (int): HTTP like status code of the operation.
+        affected_rows (int): Rows written or deleted in the database.
+        inserted (int): New rows.
+        updated (int): Existing rows whose values changed.
+        skipped (int): Rows left untouched: duplicates, unchanged rows or keys not found.
+        rejected (int): Rows not loaded because they are invalid.
+        reject_id (str): Id of the reject file with the rejected rows, if any.
+        message (str): Error or information message.
+        data (Any): Extra JSON serializable details of the operation.
+        frame (Any): DataFrame handed to the caller (process_csv), never serialized.
+    """
+    operation: str
+    status: str = 'failure'
+    status_code: int = 500
+    affected_rows: int = 0
+    inserted: int = 0
+    updated: int = 0
+    skipped: int = 0
+    rejected: int = 0
+    reject_id: str | None = None
+    message: str = ''
+    data: Any = ''
+    frame: Any = field(default=None, repr=False)
+
+    @property
+    def ok(self) -> bool:
+        return self.status_code == 200
+
+    def succeed(self):
+        self.status = 'success'
+        self.status_code = 200
+
+    def add_counts(self, other: 'OperationResult'):
+        """Add the row counts of another result, e.g. of a chunk, to this one."""
+        self.affected_rows += other.affected_rows
+        self.inserted += other.inserted
+        self.updated += other.updated
+        self.skipped += other.skipped
+        self.rejected += other.rejected
+
+    def to_dict(self) -> dict:
+        return {
+            'status': self.status,
+            'status_code': self.status_code,
+            'operation': self.operation,
+            'affected_rows': self.affected_rows,
+            'inserted': self.inserted,
+            'updated': self.updated,
+            'skipped': self.skipped,
+            'rejected': self.rejected,
+            'reject_id': self.reject_id,
+            'message': self.message,
+            'data': self.data
+        }
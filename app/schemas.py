@@ -0,0 +1,69 @@
+from pydantic import BaseModel, Field, create_model
+from sqlalchemy import Table, Integer, DateTime
+from typing import Annotated, Literal, Union
+from datetime import datetime
+
+from app.models import departments, jobs, hired_employees
+from app.config import BATCH_MAX_ROWS, LOOKUP_MAX_KEYS
+
+# Tables that accept JSON batch ingestion
+BATCH_TABLES = (departments, jobs, hired_employees)
+
+
+def record_model(table: Table) -> type[BaseModel]:
+    """
+    Generate the Pydantic model of a table row from its SQLAlchemy columns.
+
+    Args:
+        table (Table): SQLAlchemy Table object.
+
+    Returns:
+        type[BaseModel]: Model with one field per column, optional when the column is nullable.
+    """
+    fields = {}
+    for column in table.columns:
+        if isinstance(column.type, Integer):
+            python_type = int
+        elif isinstance(column.type, DateTime):
+            python_type = datetime
+        else:
+            python_type = str
+
+        if column.nullable and not column.primary_key:
+            fields[column.name] = (python_type | None, None)
+        else:
+            fields[column.name] = (python_type, ...)
+
+    model_name = ''.join(part.capitalize() for part in table.name.split('_')) + 'Record'
+
+    return create_model(model_name, **fields)
+
+
+def batch_model(table: Table) -> type[BaseModel]:
+    """Generate the batch payload model of a table: its name and a bounded list of rows."""
+    model_name = ''.join(part.capitalize() for part in table.name.split('_')) + 'Batch'
+
+    return create_model(
+        model_name,
+        table_name=(Literal[table.name], ...),
+        records=(list[record_models[table.name]], Field(min_length=1, max_length=BATCH_MAX_ROWS))
+    )
+
+
+record_models = {table.name: record_model(table) for table in BATCH_TABLES}
+
+# Request body of /batch_insert/, the table_name field selects the row model
+BatchInsert = Annotated[
+    Union[tuple(batch_model(table) for table in BATCH_TABLES)],
+    Field(discriminator='table_name')
+]
+
+
+class BulkLookup(BaseModel):
+    """Request body of the bulk /get_info lookup: key columns and the keys to fetch."""
+    id_columns: list[str] = Field(default=['id'], min_length=1)
+    ids: list[int | str | list[int | str]] = Field(min_length=1, max_length=LOOKUP_MAX_KEYS)
+
+
+class BulkDelete(BulkLookup):
+    """Request body of the bulk delete: key columns and the keys to delete."""
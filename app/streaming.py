@@ -0,0 +1,161 @@
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from sqlalchemy import Integer, Float, Numeric, Boolean, DateTime, Date
+from datetime import date, datetime
+from decimal import Decimal
+import importlib.util
+import json
+import io
+
+from app.config import read_engine, STREAM_BATCH_ROWS
+
+# Streamed formats by the media type that requests them in the Accept header
+MEDIA_TYPES = {
+    'application/x-ndjson': 'ndjson',
+    'application/vnd.apache.arrow.stream': 'arrow',
+    'application/vnd.apache.parquet': 'parquet'
+}
+
+
+def negotiate_format(accept: str | None) -> str | None:
+    """
+    Pick the streamed format requested by an Accept header.
+
+    Args:
+        accept (str | None): Value of the Accept header.
+
+    Returns:
+        str | None: 'ndjson', 'arrow' or 'parquet', None when the default JSON answer must be used.
+    """
+    for media_range in (accept or '').split(','):
+        media_type = media_range.split(';')[0].strip().lower()
+        if media_type in MEDIA_TYPES:
+            return MEDIA_TYPES[media_type]
+
+    return None
+
+
+def json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+
+    return str(value)
+
+
+def iter_batches(stmt, params: dict | None = None, batch_size: int = STREAM_BATCH_ROWS):
+    """
+    Run a query with a server side cursor and yield its rows in batches.
+
+    Args:
+        stmt (Select): SQLAlchemy statement to run.
+        params (dict, optional): Bound parameters of the statement.
+        batch_size (int): Rows fetched per batch.
+
+    Yields:
+        tuple[list[str], list[Row]]: Column names and the rows of the batch.
+    """
+    with read_engine.connect() as conn:
+        result = conn.execution_options(yield_per=batch_size).execute(stmt, params or {})
+        keys = list(result.keys())
+
+        for rows in result.partitions():
+            yield keys, rows
+
+
+def encode_ndjson(batches):
+    for keys, rows in batches:
+        yield ''.join(
+            json.dumps(dict(zip(keys, row)), default=json_default) + '\n'
+            for row in rows
+        ).encode()
+
+
+def arrow_schema(pa, stmt):
+    """Build the Arrow schema of a statement from the SQLAlchemy types of its columns."""
+    fields = []
+    for column in stmt.selected_columns:
+        if isinstance(column.type, Boolean):
+            arrow_type = pa.bool_()
+        elif isinstance(column.type, Integer):
+            arrow_type = pa.int64()
+        elif isinstance(column.type, (Float, Numeric)):
+            arrow_type = pa.float64()
+        elif isinstance(column.type, DateTime):
+            arrow_type = pa.timestamp('us')
+        elif isinstance(column.type, Date):
+            arrow_type = pa.date32()
+        else:
+            arrow_type = pa.string()
+
+        fields.append(pa.field(column.name, arrow_type))
+
+    return pa.schema(fields)
+
+
+def encode_arrow(batches, stmt, file_format: str):
+    """
+    Encode batches of rows as an Arrow IPC stream or a Parquet file, one record batch
+    (or row group) at a time.
+
+    Args:
+        batches (iterator): Batches yielded by iter_batches.
+        stmt (Select): Statement producing the rows, used to build the schema.
+        file_format (str): 'arrow' or 'parquet'.
+
+    Yields:
+        bytes: Encoded chunks.
+    """
+    import pyarrow as pa
+
+    schema = arrow_schema(pa, stmt)
+    sink = io.BytesIO()
+
+    if file_format == 'parquet':
+        import pyarrow.parquet as pq
+        writer = pq.ParquetWriter(sink, schema)
+    else:
+        writer = pa.ipc.new_stream(sink, schema)
+
+    def drain():
+        data = sink.getvalue()
+        sink.seek(0)
+        sink.truncate()
+        return data
+
+    for keys, rows in batches:
+        columns = list(zip(*rows))
+        batch = pa.RecordBatch.from_arrays(
+            [pa.array(column, type=field.type) for column, field in zip(columns, schema)],
+            schema=schema
+        )
+        writer.write_batch(batch)
+        yield drain()
+
+    writer.close()
+    yield drain()
+
+
+def stream_query(stmt, params: dict | None, file_format: str) -> StreamingResponse:
+    """
+    Stream the rows of a query straight from the DB cursor, without building a DataFrame.
+
+    Args:
+        stmt (Select): SQLAlchemy statement with typed columns.
+        params (dict | None): Bound parameters of the statement.
+        file_format (str): 'ndjson', 'arrow' or 'parquet'.
+
+    Returns:
+        StreamingResponse: Response encoding the rows while they are fetched.
+    """
+    media_type = next(media for media, fmt in MEDIA_TYPES.items() if fmt == file_format)
+    batches = iter_batches(stmt, params)
+
+    if file_format == 'ndjson':
+        return StreamingResponse(encode_ndjson(batches), media_type=media_type)
+
+    if importlib.util.find_spec('pyarrow') is None:
+        raise HTTPException(status_code=406, detail=f"{media_type} responses need pyarrow installed")
+
+    return StreamingResponse(encode_arrow(batches, stmt, file_format), media_type=media_type)
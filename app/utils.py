@@ -1,32 +1,118 @@
-from sqlalchemy import Table, Integer, String, DateTime, or_
+from sqlalchemy import Table, Column, MetaData, Integer, BigInteger, String, DateTime, Boolean
+from sqlalchemy import select, func, tuple_, literal_column, any_, bindparam, values, and_, exists, union_all
+from sqlalchemy import column as sql_column
+from sqlalchemy.dialects.postgresql import insert as pg_insert, ARRAY
 from psycopg2.extensions import register_adapter, AsIs
 import pandas as pd
 import numpy as np
+from datetime import datetime
+from functools import partial
+from typing import BinaryIO
+import tempfile
+import time
 import os
 
-from app.models import metadata
-from app.config import engine
+from app.models import hired_employees
+from app.catalog import get_table, resolve_table
+from app.cache import bump_version
+from app.aggregates import apply_quarterly_deltas
+from app.metrics import timed, observe_query
+from app.results import OperationResult
+from app.validation import validate_frame, new_reject_id, write_rejects
+from app.fingerprints import (
+    changed_rows, save_fingerprints, forget_fingerprints, file_digest, last_file_digest, save_file_digest
+)
+from app.partitions import is_partitioned, ensure_partitions, hold_partitions, lock_keys
+from app.config import engine, read_engine, CSV_CHUNKSIZE, LOAD_METHODS, COPY_BUFFER_SIZE
 
 register_adapter(np.int64, AsIs)
 register_adapter(np.float64, AsIs)
 
-# Connect metadata with engine, to reflect tables on DataBase
-metadata.reflect(bind=engine)
 
-# Message to send when functions end
-message_to_return = {
-    'status':'',
-    'status_code': 102,
-    'affected_rows': 0,
-    'operation': '',
-    'message': '',
-    'data': ''
-}
+# Column converters compiled once per table
+schema_converters = {}
+
+
+# Value ranges of INTEGER and BIGINT columns, the upper bound excluded
+INTEGER_RANGE = (-2 ** 31, 2 ** 31)
+BIGINT_RANGE = (-2 ** 63, 2 ** 63)
+
+
+def to_integer(series: pd.Series, value_range: tuple[int, int] = INTEGER_RANGE) -> pd.Series:
+    """
+    Convert a column to nullable Int64. Values that are not whole numbers in the column
+    range (decimals, inf, overflows) become nulls, so validation rejects their rows.
+    """
+    if series.dtype == 'Int64':
+        return series
+
+    low, high = value_range
+    numbers = pd.to_numeric(series, errors='coerce')
+
+    if pd.api.types.is_float_dtype(numbers):
+        valid = np.isfinite(numbers) & (numbers == np.trunc(numbers)) & (numbers >= low) & (numbers < high)
+        return numbers.where(valid).astype('Int64')
+
+    # Nulls are set after the cast, a float round trip would lose BIGINT precision
+    valid = (numbers >= low) & (numbers < high)
+    integers = numbers.where(valid, 0).astype('Int64')
+    integers[~valid] = pd.NA
+
+    return integers
+
+
+def to_string(series: pd.Series) -> pd.Series:
+    """Convert a column to nullable string, keeping nulls as <NA>."""
+    if series.dtype == 'string':
+        return series
+
+    return series.astype('string')
+
+
+def to_datetime(series: pd.Series) -> pd.Series:
+    """Convert a column to naive datetime64, nulling values that can not be parsed."""
+    if pd.api.types.is_datetime64_dtype(series):
+        return series
+
+    return pd.to_datetime(series, errors='coerce', utc=True).dt.tz_localize(None)
+
+
+def compile_converters(table: Table) -> list:
+    """
+    Build the list of column converters for a table from its SQLAlchemy column types.
+
+    Args:
+        table (Table): SQLAlchemy Table object.
+
+    Returns:
+        list: Pairs of (column name, converter function).
+    """
+    converters = schema_converters.get(table)
+
+    if converters is None:
+        converters = []
+        for column in table.columns:
+            if isinstance(column.type, BigInteger):
+                converters.append((column.name, partial(to_integer, value_range=BIGINT_RANGE)))
+            elif isinstance(column.type, Integer):
+                converters.append((column.name, to_integer))
+            elif isinstance(column.type, String):
+                converters.append((column.name, to_string))
+            elif isinstance(column.type, DateTime):
+                converters.append((column.name, to_datetime))
+
+        schema_converters[table] = converters
+
+    return converters
+
 
 def df_to_schema(df: pd.DataFrame, table: Table):
     """
     Align the DataFrame's column types with the SQLAlchemy table schema.
 
+    Conversions are vectorized into nullable dtypes (Int64, string, datetime64). The
+    converted DataFrame is marked in df.attrs, so aligning it again returns it untouched.
+
     Args:
         df (pd.DataFrame): DataFrame containing the data to align.
         table (Table): SQLAlchemy Table object.
@@ -34,330 +120,688 @@ def df_to_schema(df: pd.DataFrame, table: Table):
     Returns:
         pd.DataFrame: Converted DataFrame.
     """
-    # Replace null values with None, the engine works with None
-    df = df.replace({np.nan: None})
-
-    for column in table.columns:
-        if column.name in df.columns:
-            if isinstance(column.type, Integer):
-                df[column.name] = df[column.name].astype('Int64', errors='ignore')
-                df[column.name] = df[column.name].apply(
-                    lambda x: int(x) if (
-                        isinstance(x, int) or isinstance(x, float) and not np.isnan(x)
-                    ) else None
-                )
-            elif isinstance(column.type, String):
-                df[column.name] = df[column.name].astype(str)
-            elif isinstance(column.type, DateTime):
-                df[column.name] = pd.to_datetime(df[column.name], errors='ignore').dt.tz_localize(None)
+    if df.attrs.get('schema') == table.name:
+        return df
+
+    with timed('df_to_schema', df.shape[0]):
+        df = df.copy(deep=False)
+
+        for column_name, converter in compile_converters(table):
+            if column_name in df.columns:
+                df[column_name] = converter(df[column_name])
 
-    df = df.replace({np.nan: None})
+    df.attrs['schema'] = table.name
 
     return df
 
 
-# Process CSV and upload to DB
-def process_csv(file_path: str) -> dict:
+def to_records(df: pd.DataFrame) -> list[dict]:
+    """
+    Convert a schema aligned DataFrame into a list of dicts the DB driver can adapt.
+
+    Args:
+        df (pd.DataFrame): DataFrame containing the data.
+
+    Returns:
+        list[dict]: One dict per row, with nulls as None.
+    """
+    return df.astype(object).where(df.notna(), None).to_dict(orient='records')
+
+
+def get_table_from_file(file_path: str) -> Table:
     """
-    Take a csv and process the data.
+    Infer the destination table of a CSV file from its name, falling back to the catalog table.
 
     Args:
         file_path (str): Path to the file.
 
     Returns:
-        dict: Result of the operation with affected rows, status and pd.DataFrame.
+        Table: SQLAlchemy Table object where the file data must be loaded.
     """
-    # Final message variables
-    status = 'failure'
-    status_code = 500
-    affected_rows = 0
-    operation = 'process_csv'
-    message = ''
+    table_name = os.path.splitext(os.path.basename(file_path))[0]
+    table = resolve_table(table_name)
+
+    if table == None:
+        message = f'Table {table_name} does not exist or not containing in catalog table'
+        raise KeyError(message)
+
+    return table
+
+
+def source_name(source: str | BinaryIO, file_name: str | None = None) -> str:
+    """Name of an upload source resolving its table: file_name if given, else the source path."""
+    if file_name:
+        return file_name
+    if isinstance(source, str):
+        return source
+
+    raise ValueError('A file name is needed to resolve the table of a stream')
+
+
+def release_source(source: str | BinaryIO):
+    """Remove a spilled upload file once read, streams are closed by their owner."""
+    if isinstance(source, str):
+        os.remove(source)
+
+
+def csv_options(table: Table) -> dict:
+    """
+    pandas.read_csv options for upload files: no header and the table columns in order.
+    The trailing reason columns of reject files are ignored, so fixed reject files can be
+    uploaded again as they are.
+    """
+    cols = table.columns.keys()
+
+    # Select by position, pandas refuses more names than columns in files without reasons
+    return {'sep': ',', 'names': cols, 'usecols': list(range(len(cols)))}
+
+
+def reject_invalid(df: pd.DataFrame, table: Table, result: OperationResult) -> pd.DataFrame:
+    """
+    Align a DataFrame with the table schema and drop its invalid rows, which are appended
+    to the reject file of the result (created on the first reject) and counted as rejected.
+
+    Args:
+        df (pd.DataFrame): Rows to validate.
+        table (Table): SQLAlchemy Table object.
+        result (OperationResult): Result of the running operation.
+
+    Returns:
+        pd.DataFrame: Valid converted rows.
+    """
+    converted = df_to_schema(df, table)
+
+    with timed('validate', df.shape[0]):
+        valid, rejects = validate_frame(df, converted, table)
+
+    if not rejects.empty:
+        result.reject_id = result.reject_id or new_reject_id(table.name)
+        write_rejects(rejects, table, result.reject_id)
+        result.rejected += rejects.shape[0]
+
+    return valid
+
+
+# Process CSV and upload to DB
+def process_csv(source: str | BinaryIO, delta: bool = False, file_name: str | None = None) -> OperationResult:
+    """
+    Take a csv and process the data. Invalid rows are written to a reject file instead of
+    failing the whole file.
+
+    Args:
+        source (str | BinaryIO): Path to the file, removed once read, or binary stream of the
+            upload, read in place.
+        delta (bool): Skip the file when it matches the last file fully loaded into its table.
+        file_name (str, optional): Name of the uploaded file, resolves the table of a stream.
+
+    Returns:
+        OperationResult: Result of the operation, the valid converted rows are in result.frame
+            (None when the file was skipped) and the file digest in data.
+    """
+    result = OperationResult('process_csv', data={'table_name': '', 'digest': None})
 
     try:
-        # Infer table name from file name
-        table_name = os.path.splitext(os.path.basename(file_path))[0]
-        
-        try:
-            table = metadata.tables.get(table_name)
-            
-            if table == None:
-                    catalog_table = metadata.tables.get('catalog_tables')
-
-                    with engine.begin() as conn:
-                        catalog_records = conn.execute(
-                            catalog_table.select()
-                        )
-                        conn.close()
-
-                    df_catalog = pd.DataFrame(
-                        catalog_records.fetchall(),
-                        columns=catalog_records.keys()
-                    ).set_index('file_name')
-
-                    map_names_tables = df_catalog.to_dict()['table_name']
-                    try:
-                        table_name = map_names_tables[table_name]
-                        table = metadata.tables.get(table_name)
-
-                    except:
-                        message = f'Table {table_name} does not exist or not containing in catalog table'
-                        raise KeyError(message)
-        
-        except Exception as e:            
-            message = str(e)
-        
-        cols = table.columns.keys()
+        table = get_table_from_file(source_name(source, file_name))
+        result.data['table_name'] = table.name
+
+        if delta:
+            result.data['digest'] = file_digest(source)
+            if result.data['digest'] == last_file_digest(table.name):
+                result.data['unchanged_file'] = True
+                result.message = f'File unchanged since its last load into {table.name}.'
+                result.succeed()
+                return result
 
         # Load CSV data
-        df = pd.read_csv(
-            file_path
-            , sep=','
-            , names=cols
-        )
+        with timed('read_csv') as stage:
+            df = pd.read_csv(source, **csv_options(table))
+            stage['rows'] = df.shape[0]
+
+        result.frame = reject_invalid(df, table, result)
+        result.affected_rows = result.frame.shape[0]
+        result.succeed()
+
+    except Exception as e:
+        result.message = f"Error processing file {file_name or source}: {str(e)}"
+
+    finally:
+        release_source(source)
+
+    return result
+
+
+def read_csv_chunks(source: str | BinaryIO, table: Table, chunksize: int):
+    """
+    Read a CSV file in bounded chunks.
+
+    Args:
+        source (str | BinaryIO): Path to the file or binary stream.
+        table (Table): SQLAlchemy Table object.
+        chunksize (int): Number of rows per chunk.
+
+    Yields:
+        pd.DataFrame: Chunk of the file as read, not converted yet.
+    """
+    with pd.read_csv(source, chunksize=chunksize, **csv_options(table)) as reader:
+        while True:
+            with timed('read_csv') as stage:
+                df = next(reader, None)
+                stage['rows'] = 0 if df is None else df.shape[0]
+
+            if df is None:
+                break
+
+            yield df
+
+
+# Stream a CSV into the DB chunk by chunk
+def ingest_csv(
+    source: str | BinaryIO,
+    id_columns: list[str],
+    chunksize: int = CSV_CHUNKSIZE,
+    method: str = 'insert',
+    progress=None,
+    delta: bool = False,
+    file_name: str | None = None
+) -> OperationResult:
+    """
+    Process a csv in chunks and upsert every chunk, so memory usage does not depend on file size.
+
+    Args:
+        source (str | BinaryIO): Path to the file, removed once read, or binary stream of the
+            upload, read in place.
+        id_columns (list[str]): List of columns representing the primary key.
+        chunksize (int): Number of rows per chunk.
+        method (str): Load strategy for new records, 'insert' (executemany) or 'copy' (PostgreSQL COPY).
+        progress (callable, optional): Called after every chunk with table name, processed rows and chunks.
+        delta (bool): Skip the file when it matches the last file fully loaded into its table,
+            and skip unchanged rows by their fingerprints.
+        file_name (str, optional): Name of the uploaded file, resolves the table of a stream.
+
+    Returns:
+        OperationResult: Result of the operation with the counts of all chunks.
+    """
+    result = OperationResult('ingest_csv')
+
+    try:
+        table = get_table_from_file(source_name(source, file_name))
+
+        digest = None
+        if delta:
+            digest = file_digest(source)
+            if digest == last_file_digest(table.name):
+                result.data = {'table_name': table.name, 'unchanged_file': True}
+                result.message = f'File unchanged since its last load into {table.name}.'
+                result.succeed()
+                return result
+
+        processed_rows = 0
+        chunks = 0
+        for df in read_csv_chunks(source, table, chunksize):
+            rows = df.shape[0]
+            df = reject_invalid(df, table, result)
+
+            chunk_result = update_records(table.name, df, id_columns, method, delta=delta)
+            if not chunk_result.ok:
+                message = f"Chunk {chunks} failed: {chunk_result.message}"
+                raise ValueError(message)
+
+            processed_rows += rows
+            result.add_counts(chunk_result)
+            chunks += 1
+
+            if progress:
+                progress(table.name, processed_rows, chunks)
+
+        # Files with rejects are loaded again in full, rows may become valid (e.g. references)
+        if delta and result.rejected == 0:
+            save_file_digest(table.name, digest, processed_rows)
+
+        result.data = {
+            'table_name': table.name,
+            'processed_rows': processed_rows,
+            'chunks': chunks
+        }
+        result.succeed()
 
-        df = df_to_schema(df, table)
-        
-        status = 'success'
-        status_code = 200
-        affected_rows = df.shape[0]
-    
     except Exception as e:
-        message = f"Error processing file {file_path}: {str(e)}"
-        df = ''
-    
+        result.message = f"Error processing file {file_name or source}: {str(e)}"
+
     finally:
-        os.remove(file_path)
+        release_source(source)
+
+    return result
 
-        message_to_return['status'] = status
-        message_to_return['status_code'] = status_code
-        message_to_return['operation'] = operation
-        message_to_return['affected_rows'] = affected_rows
-        message_to_return['message'] = message
-        message_to_return['data'] = {'dataframe':df, 'table_name':table_name}
 
-        return message_to_return
+def copy_records(conn, table: Table, df: pd.DataFrame) -> int:
+    """
+    Bulk load a schema aligned DataFrame into the table through PostgreSQL COPY FROM STDIN.
+
+    Args:
+        conn (Connection): Open SQLAlchemy connection, the load joins its transaction.
+        table (Table): SQLAlchemy Table object.
+        df (pd.DataFrame): DataFrame containing the data to load.
+
+    Returns:
+        int: Number of copied rows.
+    """
+    preparer = conn.dialect.identifier_preparer
+    columns = [col for col in table.columns.keys() if col in df.columns]
+
+    sql = (
+        f"COPY {preparer.format_table(table)} ({', '.join(preparer.quote(col) for col in columns)}) "
+        f"FROM STDIN WITH (FORMAT csv, NULL '\\N')"
+    )
+
+    # Spooled buffer: small loads stay in memory, big ones spill to disk
+    with tempfile.SpooledTemporaryFile(max_size=COPY_BUFFER_SIZE, mode='w+', newline='') as buffer:
+        df[columns].to_csv(buffer, index=False, header=False, na_rep='\\N')
+        buffer.seek(0)
+
+        # COPY runs on the raw DBAPI cursor, which SQLAlchemy execution events do not see
+        cursor = conn.connection.cursor()
+        start = time.perf_counter()
+        try:
+            cursor.copy_expert(sql, buffer)
+            copied_rows = cursor.rowcount
+        finally:
+            observe_query(time.perf_counter() - start)
+            cursor.close()
+
+    return copied_rows
+
+
+def key_index(df: pd.DataFrame, id_columns: list[str]) -> pd.Index:
+    """Keys of a DataFrame as an Index (a MultiIndex for composite keys), for vectorized isin lookups."""
+    if len(id_columns) == 1:
+        return pd.Index(df[id_columns[0]])
+
+    return pd.MultiIndex.from_frame(df[id_columns])
+
+
+def select_existing_keys(conn, table: Table, df: pd.DataFrame, id_columns: list[str]) -> pd.DataFrame:
+    """
+    Fetch the keys of a DataFrame that are already stored in the table.
+
+    A single key column is looked up with = ANY(:ids) and one array parameter, composite
+    keys are staged in a temporary table and joined with the table, so the statement size
+    does not grow with the number of rows.
+
+    Args:
+        conn (Connection): Open SQLAlchemy connection.
+        table (Table): SQLAlchemy Table object.
+        df (pd.DataFrame): Schema aligned DataFrame with the incoming rows.
+        id_columns (list[str]): List of columns representing the primary key.
+
+    Returns:
+        pd.DataFrame: Stored keys, with the id_columns as columns.
+    """
+    keys = df[id_columns].dropna()
+    if keys.empty:
+        return pd.DataFrame(columns=id_columns)
+
+    if len(id_columns) == 1:
+        column = table.c[id_columns[0]]
+        stmt = select(column).where(
+            column == any_(bindparam('ids', keys[column.name].tolist(), type_=ARRAY(column.type)))
+        )
+
+    else:
+        stage = stage_records(conn, table, keys, 'copy')
+        stmt = select(*[table.c[col] for col in id_columns]).join(
+            stage, and_(*[table.c[col] == stage.c[col] for col in id_columns])
+        )
+
+    return pd.DataFrame(conn.execute(stmt).fetchall(), columns=id_columns)
 
 
 # Insert records function
-def insert_records(table_name: str, df: pd.DataFrame, id_columns: list[str]) -> dict:
+def insert_records(
+    table_name: str,
+    df: pd.DataFrame,
+    id_columns: list[str],
+    method: str = 'insert',
+    reject_id: str | None = None
+) -> OperationResult:
     """
     Insert records into the specified table, ensuring no duplicate primary keys.
 
+    Duplicate keys within the DataFrame are dropped (the first occurrence wins) and keys
+    already stored are skipped, found with one lookup per call instead of one filter per row.
+    Invalid rows are written to a reject file and the valid ones are inserted.
+
     Args:
         table_name (str): Name of the table.
         df (pd.DataFrame): DataFrame containing the data to insert.
         id_columns (list[str]): List of columns representing the primary key.
+        method (str): Load strategy, 'insert' (executemany) or 'copy' (PostgreSQL COPY).
+        reject_id (str, optional): Reject file to append rejected rows to.
 
     Returns:
-        dict: Result of the operation with affected rows and status.
+        OperationResult: Result of the operation with inserted, skipped (duplicate) and rejected rows.
     """
-    # Final message variables
-    status = 'failure'
-    status_code = 500
-    affected_rows = 0
-    operation = 'insert'
-    message = ''
-    data = ''
+    result = OperationResult('insert', reject_id=reject_id)
 
     try:
-        table = metadata.tables.get(table_name)
+        if method not in LOAD_METHODS:
+            message = f'Load method {method} not supported, use one of {LOAD_METHODS}.'
+            raise ValueError(message)
+
+        table = get_table(table_name)
         if table == None:
             message = f'Table {table_name} does not exist.'
             raise ValueError(message)
         
-        df = df_to_schema(df, table)
+        df = reject_invalid(df, table, result)
+        incoming_rows = df.shape[0]
+
+        # In-file duplicates: the first occurrence of a key is inserted
+        df = df.drop_duplicates(subset=id_columns, keep='first')
+        ensure_partitions(table, df)
 
         with engine.begin() as conn:
-            # Check for existing records with matching IDs
-            id_filter = [
-                (table.c[col] == df[col].iloc[i]) for i in range(len(df))
-                for col in id_columns
-            ]
-            
-            # Build query to find existing records
-            existing_query = conn.execute(
-                table.select().where(or_(*id_filter))
-            )
-            existing_records = pd.DataFrame(
-                existing_query.fetchall(),
-                columns=existing_query.keys()
-            )
+            # Partitioned tables have no unique key on the ids and hired_employees keeps the
+            # quarterly aggregates in step, writers of those tables take turns
+            if is_partitioned(table.name) or table.name == hired_employees.name:
+                lock_keys(conn, table.name)
+            hold_partitions(conn, table, df)
+
+            with timed('fetch_existing') as stage:
+                existing_keys = select_existing_keys(conn, table, df, id_columns)
+                stage['rows'] = existing_keys.shape[0]
 
             # Determine non-existing records
-            if not existing_records.empty:
-                existing_set = set(existing_records[id_columns].itertuples(index=False, name=None))
-                incoming_set = set(df[id_columns].itertuples(index=False, name=None))
-                non_existing_set = incoming_set - existing_set
-                non_existing_df = df[df[id_columns].apply(tuple, axis=1).isin(non_existing_set)]
-            else:
-                non_existing_df = df
+            with timed('compare', df.shape[0]):
+                non_existing_df = df[~key_index(df, id_columns).isin(key_index(existing_keys, id_columns))]
 
             print(f'Inserting records into table {table_name}')
             # Insert non-existing records
             if not non_existing_df.empty:
-                result = conn.execute(
-                    table.insert()
-                    , non_existing_df.to_dict(orient='records')
-                )
-                conn.commit()
-                conn.close()
+                with timed(method, non_existing_df.shape[0]):
+                    if method == 'copy':
+                        result.affected_rows = copy_records(conn, table, non_existing_df)
 
-                status = 'success'
-                status_code = 200
-                affected_rows = result.rowcount
+                    else:
+                        result.affected_rows = conn.execute(
+                            table.insert()
+                            , to_records(non_existing_df)
+                        ).rowcount
 
-            else:
-                conn.close()
+                if table.name == hired_employees.name:
+                    apply_quarterly_deltas(conn, non_existing_df['id'].dropna().tolist(), 1)
+
+                forget_fingerprints(conn, table.name, non_existing_df, id_columns)
+
+            elif not df.empty:
                 message = 'Only duplicates primary keys detected.'
                 raise ValueError(message)
 
+        bump_version(table_name)
+
+        result.inserted = result.affected_rows
+        result.skipped = incoming_rows - non_existing_df.shape[0]
+        result.succeed()
+
     except Exception as e:
-        message = str(e)
-    
-    finally:
+        result.message = str(e)
+
+    return result
+
+
+def stage_records(conn, table: Table, df: pd.DataFrame, method: str = 'copy') -> Table:
+    """
+    Load the DataFrame into a temporary table shaped like the target table, dropped on commit.
+
+    Args:
+        conn (Connection): Open SQLAlchemy connection, the staging table lives in its transaction.
+        table (Table): SQLAlchemy Table object used as template.
+        df (pd.DataFrame): DataFrame containing the data to stage.
+        method (str): Load strategy, 'insert' (executemany) or 'copy' (PostgreSQL COPY).
+
+    Returns:
+        Table: SQLAlchemy Table object of the staging table.
+    """
+    stage = Table(
+        f'stage_{table.name}', MetaData(),
+        *[Column(column.name, column.type) for column in table.columns],
+        prefixes=['TEMPORARY'],
+        postgresql_on_commit='DROP'
+    )
+    stage.create(conn)
+
+    if not df.empty:
+        with timed('stage', df.shape[0]):
+            if method == 'copy':
+                copy_records(conn, stage, df)
+
+            else:
+                conn.execute(stage.insert(), to_records(df))
+
+    return stage
+
+
+def upsert_statement(table: Table, stage: Table, id_columns: list[str], per_row: bool = False):
+    """
+    Build a single statement that upserts the staged rows and counts inserted and updated rows.
+
+    Rows whose values are not distinct from the stored ones are left untouched, so change
+    detection runs in the database.
+
+    Args:
+        table (Table): SQLAlchemy Table object to upsert into.
+        stage (Table): SQLAlchemy Table object with the staged rows.
+        id_columns (list[str]): List of columns representing the primary key.
+        per_row (bool): Return the key and an inserted flag of every written row instead.
 
-        message_to_return['status'] = status
-        message_to_return['status_code'] = status_code
-        message_to_return['operation'] = operation
-        message_to_return['affected_rows'] = affected_rows
-        message_to_return['message'] = message
-        message_to_return['data'] = data
+    Returns:
+        Select: Statement returning one row with the inserted and updated counts.
+    """
+    columns = table.columns.keys()
+    update_columns = [col for col in columns if col not in id_columns]
+
+    stmt = pg_insert(table).from_select(
+        columns,
+        select(*[stage.c[col] for col in columns])
+    )
+
+    if update_columns:
+        stmt = stmt.on_conflict_do_update(
+            index_elements=id_columns,
+            set_={col: stmt.excluded[col] for col in update_columns},
+            where=tuple_(*[table.c[col] for col in update_columns]).is_distinct_from(
+                tuple_(*[stmt.excluded[col] for col in update_columns])
+            )
+        )
+    else:
+        stmt = stmt.on_conflict_do_nothing(index_elements=id_columns)
+
+    # xmax is 0 only for freshly inserted tuples
+    upserted = stmt.returning(
+        *[table.c[col] for col in id_columns],
+        literal_column('xmax = 0', Boolean).label('inserted')
+    ).cte('upserted')
+
+    if per_row:
+        return select(*[upserted.c[col] for col in id_columns], upserted.c.inserted)
+
+    return select(
+        func.count().filter(upserted.c.inserted).label('inserted'),
+        func.count().filter(~upserted.c.inserted).label('updated')
+    )
+
+
+def merge_statement(table: Table, stage: Table, id_columns: list[str], per_row: bool = False):
+    """
+    Build the upsert of upsert_statement without ON CONFLICT, for partitioned tables that
+    have no unique index on the keys: stored keys are updated when their values changed
+    (moving rows between partitions when the partition column changes) and the other
+    staged rows are inserted with an anti-join. Run it holding lock_keys.
 
-        return message_to_return    
+    Args:
+        table (Table): SQLAlchemy Table object to upsert into.
+        stage (Table): SQLAlchemy Table object with the staged rows.
+        id_columns (list[str]): List of columns representing the primary key.
+        per_row (bool): Return the key and an inserted flag of every written row instead.
+
+    Returns:
+        Select: Statement returning one row with the inserted and updated counts.
+    """
+    columns = table.columns.keys()
+    update_columns = [col for col in columns if col not in id_columns]
+    same_key = [table.c[col] == stage.c[col] for col in id_columns]
+
+    stored = table.alias('stored')
+    inserted = table.insert().from_select(
+        columns,
+        select(*[stage.c[col] for col in columns]).where(
+            ~exists().where(*[stored.c[col] == stage.c[col] for col in id_columns])
+        )
+    ).returning(*[table.c[col] for col in id_columns]).cte('inserted')
+
+    rows = [select(*[inserted.c[col] for col in id_columns], literal_column('TRUE', Boolean).label('inserted'))]
+    counts = [select(func.count()).select_from(inserted).scalar_subquery().label('inserted')]
+
+    if update_columns:
+        updated = table.update().where(
+            *same_key,
+            tuple_(*[table.c[col] for col in update_columns]).is_distinct_from(
+                tuple_(*[stage.c[col] for col in update_columns])
+            )
+        ).values({col: stage.c[col] for col in update_columns}).returning(
+            *[table.c[col] for col in id_columns]
+        ).cte('updated')
+
+        rows.append(select(*[updated.c[col] for col in id_columns], literal_column('FALSE', Boolean).label('inserted')))
+        counts.append(select(func.count()).select_from(updated).scalar_subquery().label('updated'))
+    else:
+        counts.append(literal_column('0').label('updated'))
+
+    if per_row:
+        return union_all(*rows)
+
+    return select(*counts)
 
 
 # Update records function
-def update_records(table_name: str, df: pd.DataFrame, id_columns: list[str]) -> dict:
+def update_records(
+    table_name: str,
+    df: pd.DataFrame,
+    id_columns: list[str],
+    method: str = 'insert',
+    reject_id: str | None = None,
+    delta: bool = False,
+    return_keys: bool = False
+) -> OperationResult:
     """
-    Update records in the specified table based on the provided DataFrame.
+    Upsert records in the specified table based on the provided DataFrame.
+
+    Incoming rows are staged in a temporary table and applied with one
+    INSERT ... ON CONFLICT DO UPDATE statement inside a single transaction
+    (UPDATE and anti-join INSERT on partitioned tables, see merge_statement).
+    Invalid rows are written to a reject file and the valid ones are upserted.
+    In delta mode, rows matching the fingerprint of their last delta load are
+    skipped before staging, and fingerprints are saved for the loaded rows.
 
     Args:
         table_name (str): Name of the table.
         df (pd.DataFrame): DataFrame containing the data to update.
         id_columns (list[str]): List of columns representing the primary key.
+        method (str): Load strategy for the staging table, 'insert' (executemany) or 'copy' (PostgreSQL COPY).
+        reject_id (str, optional): Reject file to append rejected rows to.
+        delta (bool): Skip rows whose content did not change since their last delta load.
+        return_keys (bool): Put the keys of the written rows, with an inserted flag, in result.frame.
 
     Returns:
-        dict: Result of the operation with affected rows and status.
+        OperationResult: Result of the operation with inserted, updated, skipped (unchanged) and rejected rows.
     """
-    # Final message variables
-    status = 'failure'
-    status_code = 500
-    affected_rows = 0
-    operation = 'update'
-    message = ''
-    data = ''
+    result = OperationResult('update', reject_id=reject_id)
 
     try:
-        table = metadata.tables.get(table_name)
+        if method not in LOAD_METHODS:
+            message = f'Load method {method} not supported, use one of {LOAD_METHODS}.'
+            raise ValueError(message)
+
+        table = get_table(table_name)
         if table == None:
             message = f'Table {table_name} does not exist.'
             raise ValueError(message)
 
-        df = df_to_schema(df, table)
-        
+        df = reject_invalid(df, table, result)
+
+        # A key can only be upserted once per statement, the last occurrence wins
+        df = df.drop_duplicates(subset=id_columns, keep='last')
+        incoming_rows = df.shape[0]
+
+        partitioned = is_partitioned(table.name)
+        maintain_aggregates = table.name == hired_employees.name
+        ensure_partitions(table, df)
+
         with engine.begin() as conn:
-            # Fetch existing records from the database
-            existing_query = conn.execute(
-                table.select().where(
-                    *[table.c[col].in_(df[col].tolist()) for col in id_columns]
-                )
-            )
-            existing_records = pd.DataFrame(existing_query.fetchall(), columns=existing_query.keys())
-            existing_records = df_to_schema(existing_records, table)
-            
-            # Set index to ids
-            df = df.set_index(id_columns, drop=False)
-
-            # Identify records that have changed
-            existing_records_to_compare = existing_records.set_index(id_columns, drop=False)
-            index_existing_records_to_compare = existing_records_to_compare.index.tolist()
-            df_to_compare = df.loc[index_existing_records_to_compare]
-            
-            df_to_insert_filter = df.index.difference(index_existing_records_to_compare)
-            df_to_insert = df.loc[df_to_insert_filter]
-            
-            compare = df_to_compare.compare(existing_records_to_compare, result_names=('new_', 'old_'))
-            changed_rows = compare.index.values.tolist()
-            
-            # Insert records if not exists
-            if existing_records.empty:
-                result = insert_records(table_name, df, id_columns)
-                status = result['status']
-                status_code = result['status_code']
-                operation = result['operation']
-                affected_rows = result['affected_rows']
-                message = result['message']
-                # df = result['data']
-                raise
-
-            elif df_to_insert.shape[0] > 0 and len(changed_rows) == 0:
-                result = insert_records(table_name, df_to_insert, id_columns)
-                status = result['status']
-                status_code = result['status_code']
-                operation = result['operation']
-                affected_rows = result['affected_rows']
-                message = result['message']
-                # df = result['data']
-                raise
-
-            elif df_to_insert.shape[0] > 0 and len(changed_rows) != 0:
-                result = insert_records(table_name, df_to_insert, id_columns)
-                affected_rows = result['affected_rows']
-
-            elif df_to_insert.shape[0] == 0 and len(changed_rows) == 0:
-                status_code = 200
-                status = 'success'
-                message = 'No changes detected in the provided data.'
-                raise
-            
-            # Prepare the update operations and extract only new data
-            changed_records = df.loc[changed_rows]
-
-            for _, row in changed_records.iterrows():
-                id_filter = {col: row[col] for col in id_columns}
-                update_values = row.drop(labels=id_columns).to_dict()
-
-                # Check for existing records with matching IDs
-                id_filter = [
-                    table.c[col] == val for col, val in id_filter.items()
-                ]
-
-                result = conn.execute(
-                    table.update()
-                    .where(*id_filter)
-                    .values(**update_values)
+            # Aggregate deltas read the stored rows, no other writer may change them meanwhile
+            if partitioned or maintain_aggregates:
+                lock_keys(conn, table.name)
+            hold_partitions(conn, table, df)
+
+            if delta:
+                # Rows whose fingerprint did not change are skipped before touching the table
+                with timed('fingerprint', incoming_rows):
+                    changed, key_hashes, row_hashes = changed_rows(conn, table, df, id_columns)
+                    df = df[changed]
+                    key_hashes, row_hashes = key_hashes[changed.to_numpy()], row_hashes[changed.to_numpy()]
+
+            stage = stage_records(conn, table, df, method)
+
+            # Quarterly aggregates: take out the stored version of the rows and add the new one
+            if maintain_aggregates:
+                ids = df['id'].dropna().tolist()
+                apply_quarterly_deltas(conn, ids, -1)
+
+            with timed('upsert', df.shape[0]):
+                statement = (merge_statement if partitioned else upsert_statement)(
+                    table, stage, id_columns, per_row=return_keys
                 )
-                
-                affected_rows += result.rowcount
-            
-            
-            conn.commit()
-            conn.close()
+                if return_keys:
+                    written = pd.DataFrame(conn.execute(statement).all(), columns=[*id_columns, 'inserted'])
+                    inserted = int(written['inserted'].sum())
+                    updated = written.shape[0] - inserted
+                else:
+                    inserted, updated = conn.execute(statement).one()
+
+            if maintain_aggregates:
+                apply_quarterly_deltas(conn, ids, 1)
+
+            if delta:
+                save_fingerprints(conn, table.name, key_hashes, row_hashes)
+            else:
+                forget_fingerprints(conn, table.name, df, id_columns)
 
-        status = 'success'
-        status_code = 200
-        affected_rows += affected_rows
+        if inserted + updated:
+            bump_version(table_name)
 
-    except Exception as e:
-        message = str(e)
-    
-    finally:
+        result.inserted = inserted
+        result.updated = updated
+        result.affected_rows = inserted + updated
+        result.skipped = incoming_rows - result.affected_rows
+        if return_keys:
+            result.frame = written
+        if delta:
+            result.data = {'fingerprint_skipped': incoming_rows - df.shape[0]}
+        result.succeed()
+
+        if result.affected_rows == 0:
+            result.message = 'No changes detected in the provided data.'
 
-        message_to_return['status'] = status
-        message_to_return['status_code'] = status_code
-        message_to_return['operation'] = operation
-        message_to_return['affected_rows'] = affected_rows
-        message_to_return['message'] = message
-        message_to_return['data'] = data
+    except Exception as e:
+        result.message = str(e)
 
-        return message_to_return
+    return result
 
 
 # Delete records function
-def delete_records(table_name: str, df: pd.DataFrame, id_columns: list[str]) -> dict:
+def delete_records(table_name: str, df: pd.DataFrame, id_columns: list[str]) -> OperationResult:
     """
-    Delete records from the specified table based on the provided DataFrame.
+    Delete records from the specified table based on the provided DataFrame, with a single
+    DELETE ... WHERE id = ANY(...) statement (or DELETE ... USING a staged table for composite keys).
 
     Args:
         table_name (str): Name of the table.
@@ -365,71 +809,214 @@ def delete_records(table_name: str, df: pd.DataFrame, id_columns: list[str]) ->
         id_columns (list[str]): List of columns representing the primary key.
 
     Returns:
-        dict: Result of the operation with affected rows and status.
+        OperationResult: Result of the operation with deleted rows and skipped (not found) keys.
     """
-    # Final message variables
-    status = 'failure'
-    status_code = 500
-    affected_rows = 0
-    operation = 'delete'
-    message = ''
-    data = ''
+    result = OperationResult('delete')
 
     try:
-        table = metadata.tables.get(table_name)
+        table = get_table(table_name)
         if table == None:
             message = f'Table {table_name} does not exist.'
             raise ValueError(message)
 
-        df = df_to_schema(df, table)
+        df = df_to_schema(df[id_columns], table)
+        df = df.dropna().drop_duplicates()
 
         with engine.begin() as conn:
-            for _, row in df.iterrows():
-                id_filter = {col: row[col] for col in id_columns}
+            if table.name == hired_employees.name:
+                lock_keys(conn, table.name)
+                apply_quarterly_deltas(conn, df['id'].tolist(), -1)
+
+            if len(id_columns) == 1:
+                # One statement with the keys as a single array parameter
+                column = table.c[id_columns[0]]
+                stmt = table.delete().where(
+                    column == any_(bindparam('ids', df[column.name].tolist(), type_=ARRAY(column.type)))
+                )
 
-                result = conn.execute(
-                    table.delete()
-                    .where(*[table.c[col] == val for col, val in id_filter.items()])
+            else:
+                # Composite keys: stage them and delete with DELETE ... USING
+                stage = stage_records(conn, table, df, 'copy')
+                stmt = table.delete().where(
+                    *[table.c[col] == stage.c[col] for col in id_columns]
                 )
-                affected_rows += result.rowcount
-        
-            conn.commit()
-            conn.close()
 
-        status = 'success'
-        status_code = 200
-        affected_rows = affected_rows
+            with timed('delete', df.shape[0]):
+                result.affected_rows = conn.execute(stmt).rowcount
+
+            forget_fingerprints(conn, table.name, df, id_columns)
+
+        if result.affected_rows:
+            bump_version(table_name)
+
+        result.skipped = df.shape[0] - result.affected_rows
+        result.data = {'requested': df.shape[0]}
+        result.succeed()
 
     except Exception as e:
-        message = str(e)
-    
-    finally:
-        message_to_return['status'] = status
-        message_to_return['status_code'] = status_code
-        message_to_return['operation'] = operation
-        message_to_return['affected_rows'] = affected_rows
-        message_to_return['message'] = message
-        message_to_return['data'] = data
+        result.message = str(e)
+
+    return result
+
+
+def delete_keys(table_name: str, id_columns: list[str], ids: list) -> OperationResult:
+    """
+    Delete the records of a list of keys.
+
+    Args:
+        table_name (str): Name of the table.
+        id_columns (list[str]): List of columns representing the primary key.
+        ids (list): Keys to delete, tuples of values for composite keys.
+
+    Returns:
+        OperationResult: Result of the operation with deleted rows.
+    """
+    df = pd.DataFrame.from_records(
+        [key if isinstance(key, tuple) else (key,) for key in ids],
+        columns=id_columns
+    )
+
+    return delete_records(table_name, df, id_columns)
+
+
+def delete_csv(file, table_name: str, id_columns: list[str], chunksize: int = CSV_CHUNKSIZE) -> OperationResult:
+    """
+    Delete the records whose keys are listed in a CSV, one DELETE statement per chunk.
+
+    Args:
+        file (str | file-like): Path or stream of a CSV without header, one key per line.
+        table_name (str): Name of the table.
+        id_columns (list[str]): Columns of the CSV, representing the primary key.
+        chunksize (int): Number of keys per chunk.
+
+    Returns:
+        OperationResult: Result of the operation with total deleted rows and deleted rows per batch.
+    """
+    result = OperationResult('delete')
+
+    try:
+        batches = []
+        with pd.read_csv(file, sep=',', names=id_columns, chunksize=chunksize) as reader:
+            for df in reader:
+                batch_result = delete_records(table_name, df, id_columns)
+                if not batch_result.ok:
+                    message = f"Batch {len(batches)} failed: {batch_result.message}"
+                    raise ValueError(message)
+
+                batches.append(batch_result.affected_rows)
+                result.add_counts(batch_result)
+
+        result.data = {'batches': batches}
+        result.succeed()
+
+    except Exception as e:
+        result.message = str(e)
 
-        return message_to_return
+    return result
 
 
-def select_records(table_name: str, id_columns: str, id: str):
-    table = metadata.tables.get(table_name)
+def cast_key(column: Column, value):
+    """Convert a key received as text (e.g. from the URL) to the Python type of its column."""
+    if not isinstance(value, str):
+        return value
+    if isinstance(column.type, Integer):
+        return int(value)
+    if isinstance(column.type, DateTime):
+        return datetime.fromisoformat(value)
 
-    with engine.begin() as conn:
-        # Fetch existing records from the database
+    return value
+
+
+def select_records_stmt(table_name: str, id_columns: list[str], ids: list):
+    """
+    Build the query that fetches the records of a table matching a list of keys.
+
+    A single key column is resolved with = ANY(:ids) and one array parameter, composite
+    keys with a join against a VALUES list.
+
+    Args:
+        table_name (str): Name of the table.
+        id_columns (list[str]): Columns to filter by.
+        ids (list): Values to look for, tuples of values for composite keys.
+
+    Returns:
+        Select: SQLAlchemy select statement.
+    """
+    table = get_table(table_name)
+    if table == None:
+        raise ValueError(f'Table {table_name} does not exist.')
+
+    missing_columns = [col for col in id_columns if col not in table.c]
+    if missing_columns:
+        raise ValueError(f'Columns {missing_columns} do not exist in table {table_name}.')
+
+    if len(id_columns) == 1:
+        column = table.c[id_columns[0]]
+        id_values = [cast_key(column, value) for value in ids]
+
+        return table.select().where(
+            column == any_(bindparam('ids', id_values, type_=ARRAY(column.type)))
+        )
+
+    columns = [table.c[col] for col in id_columns]
+    keys = values(
+        *[sql_column(col.name, col.type) for col in columns],
+        name='keys'
+    ).data([
+        tuple(cast_key(col, value) for col, value in zip(columns, key))
+        for key in ids
+    ])
+
+    return table.select().join(
+        keys,
+        and_(*[col == keys.c[col.name] for col in columns])
+    )
+
+
+def select_records(table_name: str, id_columns: list[str], ids: list):
+    table = get_table(table_name)
+
+    with read_engine.begin() as conn:
+        # Fetch existing records from the database in one round trip
         data = conn.execute(
-            table.select().where(
-                # *[table.c[col].in_(id) for col in id_columns]
-                table.c[id_columns].in_([id])
-            )
+            select_records_stmt(table_name, id_columns, ids)
         )
 
-        df = pd.DataFrame(data.fetchall(), table.columns.keys())
+        df = pd.DataFrame(data.fetchall(), columns=table.columns.keys())
 
-        conn.close()
-        
     return df.to_json()
 
+
+def scan_records(table_name: str, cursor=None, limit: int = 1000) -> dict:
+    """
+    Read a page of a table with keyset pagination over its primary key.
+
+    Args:
+        table_name (str): Name of the table.
+        cursor (optional): Last key of the previous page, None for the first page.
+        limit (int): Max rows in the page.
+
+    Returns:
+        dict: The records of the page and the cursor of the next one (None on the last page).
+    """
+    table = get_table(table_name)
+    if table == None:
+        raise ValueError(f'Table {table_name} does not exist.')
+
+    key_columns = list(table.primary_key.columns)
+    if len(key_columns) != 1:
+        raise ValueError(f'Table {table_name} needs a single column primary key to be scanned.')
+
+    key = key_columns[0]
+    stmt = table.select().order_by(key).limit(limit)
+    if cursor is not None:
+        stmt = stmt.where(key > cast_key(key, cursor))
+
+    with read_engine.begin() as conn:
+        records = [dict(row._mapping) for row in conn.execute(stmt)]
+
+    next_cursor = records[-1][key.name] if len(records) == limit else None
+
+    return {'records': records, 'next_cursor': next_cursor}
+
 # TODO  Crear una función para llamar al procesamiento y luego pasar la función de insertado o actualizado
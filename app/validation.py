@@ -0,0 +1,170 @@
+from sqlalchemy import Table, select, any_, bindparam
+from sqlalchemy.dialects.postgresql import ARRAY
+import pandas as pd
+import uuid
+import re
+import os
+
+from app.config import engine, REJECTS_DIR, VALIDATE_REFERENCES
+from app.catalog import get_table
+from app.cache import cached
+
+# Reason codes of rejected rows, checked in this order (a row keeps the first one)
+INVALID_TYPE = 'invalid_type'
+MISSING_ID = 'missing_id'
+NULL_NOT_ALLOWED = 'null_not_allowed'
+UNKNOWN_REFERENCE = 'unknown_reference'
+
+# Columns added after the table columns in reject files
+REJECT_COLUMNS = ['reject_reason', 'reject_column']
+
+REJECT_ID_PATTERN = re.compile(r'(?P<table_name>\w+)-[0-9a-f]{32}')
+
+# Key loaders by referenced table, cached until the table is written or the TTL ends
+reference_loaders = {}
+
+
+def fetch_reference_keys(table_name: str) -> pd.Index:
+    table = get_table(table_name)
+    key = list(table.primary_key.columns)[0]
+
+    with engine.begin() as conn:
+        return pd.Index(conn.execute(select(key)).scalars().all())
+
+
+def fetch_missing_keys(table_name: str, keys: list) -> pd.Index:
+    """
+    Keys of a list stored in a referenced table, read live with one = ANY(:keys) lookup.
+    Confirms keys missing from the cached ones, e.g. written by another worker process.
+    """
+    table = get_table(table_name)
+    key = list(table.primary_key.columns)[0]
+
+    with engine.begin() as conn:
+        return pd.Index(conn.execute(
+            select(key).where(key == any_(bindparam('keys', keys, type_=ARRAY(key.type))))
+        ).scalars().all())
+
+
+def reference_keys(table_name: str) -> pd.Index:
+    """
+    Primary key values of a referenced table (e.g. departments ids).
+
+    Args:
+        table_name (str): Name of the referenced table.
+
+    Returns:
+        pd.Index: Stored keys.
+    """
+    loader = reference_loaders.get(table_name)
+    if loader is None:
+        loader = reference_loaders.setdefault(table_name, cached(tables=(table_name,))(fetch_reference_keys))
+
+    return loader(table_name)
+
+
+def validate_frame(
+    raw: pd.DataFrame,
+    converted: pd.DataFrame,
+    table: Table,
+    check_references: bool = VALIDATE_REFERENCES
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Split rows into valid and rejected with vectorized checks driven by the table schema:
+    values that could not be converted to the column type, null primary keys, nulls in
+    non nullable columns and values missing in the table a column references
+    (column.info['references']).
+
+    Args:
+        raw (pd.DataFrame): Rows as read, to tell invalid values from nulls.
+        converted (pd.DataFrame): The same rows aligned with the table schema.
+        table (Table): SQLAlchemy Table object.
+        check_references (bool): Check referenced keys, needs the database.
+
+    Returns:
+        tuple[pd.DataFrame, pd.DataFrame]: Valid converted rows, and rejected raw rows with
+            reject_reason and reject_column.
+    """
+    if converted.attrs.get('validated') == table.name:
+        return converted, raw.iloc[0:0]
+
+    reason = pd.Series(pd.NA, index=converted.index, dtype='string')
+    reason_column = pd.Series(pd.NA, index=converted.index, dtype='string')
+
+    def flag(mask: pd.Series, code: str, column_name: str):
+        mask = mask & reason.isna()
+        reason[mask] = code
+        reason_column[mask] = column_name
+
+    # Frames converted before (e.g. by the parse pool) can not show invalid values anymore
+    check_types = raw is not converted
+
+    for column in table.columns:
+        if column.name not in converted.columns:
+            if column.primary_key or not column.nullable:
+                code = MISSING_ID if column.primary_key else NULL_NOT_ALLOWED
+                flag(pd.Series(True, index=converted.index), code, column.name)
+            continue
+
+        values = converted[column.name]
+        is_null = values.isna()
+
+        if check_types:
+            flag(raw[column.name].notna() & is_null, INVALID_TYPE, column.name)
+
+        if column.primary_key:
+            flag(is_null, MISSING_ID, column.name)
+        elif not column.nullable:
+            flag(is_null, NULL_NOT_ALLOWED, column.name)
+
+        references = column.info.get('references')
+        if check_references and references:
+            unknown = ~is_null & ~values.isin(reference_keys(references))
+            # The cached keys can be stale, only keys missing in the database are rejected
+            if unknown.any():
+                stored = fetch_missing_keys(references, values[unknown].unique().tolist())
+                unknown &= ~values.isin(stored)
+            flag(unknown, UNKNOWN_REFERENCE, column.name)
+
+    rejected = reason.notna()
+    if not rejected.any():
+        valid, rejects = converted, raw.iloc[0:0]
+    else:
+        valid = converted[~rejected]
+        rejects = raw[rejected].assign(reject_reason=reason[rejected], reject_column=reason_column[rejected])
+
+    if check_references:
+        valid.attrs['validated'] = table.name
+
+    return valid, rejects
+
+
+def new_reject_id(table_name: str) -> str:
+    return f'{table_name}-{uuid.uuid4().hex}'
+
+
+def reject_path(reject_id: str) -> str | None:
+    """Path of a reject file, None when the id is not valid or the file does not exist."""
+    if not REJECT_ID_PATTERN.fullmatch(reject_id):
+        return None
+
+    path = os.path.join(REJECTS_DIR, f'{reject_id}.csv')
+
+    return path if os.path.exists(path) else None
+
+
+def write_rejects(rejects: pd.DataFrame, table: Table, reject_id: str):
+    """
+    Append rejected rows to a reject file: a CSV without header with the table columns in
+    upload order, so it can be fixed and uploaded again, followed by the reject reason and column.
+
+    Args:
+        rejects (pd.DataFrame): Rejected rows from validate_frame.
+        table (Table): SQLAlchemy Table object.
+        reject_id (str): Id of the reject file, from new_reject_id.
+    """
+    os.makedirs(REJECTS_DIR, exist_ok=True)
+
+    rejects.reindex(columns=[*table.columns.keys(), *REJECT_COLUMNS]).to_csv(
+        os.path.join(REJECTS_DIR, f'{reject_id}.csv'), mode='a', header=False, index=False
+    )
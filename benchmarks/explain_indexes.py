@@ -0,0 +1,62 @@
+"""
+EXPLAIN based regression check: the raw business queries must be able to use the
+hired_employees indexes declared in app/models.py.
+
+Sequential scans are disabled for the check, so on small test data the planner still
+reports an index whenever the predicates are sargable. Exits with status 1 when a query
+does not use any of its expected indexes.
+
+Usage:
+    python -m benchmarks.explain_indexes --year 2021
+"""
+import argparse
+import json
+import sys
+
+from sqlalchemy import text
+
+from app.config import engine
+from app.business import employees_hired_by_q_stmts, total_employees_by_department_stmts, year_params
+
+EXPECTED_INDEXES = {'ix_hired_employees_datetime', 'ix_hired_employees_department_id_job_id'}
+
+
+def used_indexes(plan: dict) -> set[str]:
+    """Collect the index names of every node of an EXPLAIN (FORMAT JSON) plan."""
+    indexes = {plan['Index Name']} if 'Index Name' in plan else set()
+
+    for child in plan.get('Plans', []):
+        indexes |= used_indexes(child)
+
+    return indexes
+
+
+def explain(stmt, params: dict) -> set[str]:
+    with engine.begin() as conn:
+        conn.execute(text('SET LOCAL enable_seqscan = off'))
+        plan = conn.execute(text(f'EXPLAIN (FORMAT JSON) {stmt.element.text}'), params).scalar()
+
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+
+    return used_indexes(plan[0]['Plan'])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--year', type=int, default=2021)
+    args = parser.parse_args()
+
+    params = year_params(args.year, 'raw')
+    report = {
+        'employees_hired_by_q': explain(employees_hired_by_q_stmts['raw'], params),
+        'total_employees_by_department': explain(total_employees_by_department_stmts['raw'], params)
+    }
+
+    failed = False
+    for name, indexes in report.items():
+        ok = bool(indexes & EXPECTED_INDEXES)
+        failed = failed or not ok
+        print(f"{'OK  ' if ok else 'FAIL'} {name}: {sorted(indexes) or 'no index used'}")
+
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,99 @@
+"""
+Compare the executemany INSERT path against the PostgreSQL COPY path of insert_records.
+
+Needs the database from docker-compose.yml running. The target table (and the quarterly
+aggregates for hired_employees) is truncated before every run, so do not point it to a database with data you want to keep.
+
+Usage:
+    python -m benchmarks.insert_methods --table hired_employees --rows 100000 --repeat 3
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import Integer, String, DateTime, text
+
+from app.config import engine, LOAD_METHODS
+from app.models import metadata
+from app.utils import insert_records
+
+
+def synthetic_frame(table_name: str, rows: int) -> pd.DataFrame:
+    """
+    Build a DataFrame with random data matching the table columns.
+
+    Args:
+        table_name (str): Name of the table.
+        rows (int): Number of rows to generate.
+
+    Returns:
+        pd.DataFrame: Generated data, ids go from 1 to rows.
+    """
+    rng = np.random.default_rng(42)
+    table = metadata.tables[table_name]
+    data = {}
+
+    for column in table.columns:
+        if column.name == 'id':
+            data[column.name] = np.arange(1, rows + 1)
+        elif isinstance(column.type, Integer):
+            data[column.name] = rng.integers(1, 100, rows)
+        elif isinstance(column.type, String):
+            data[column.name] = [f'{column.name}_{i}' for i in rng.integers(0, 1000, rows)]
+        elif isinstance(column.type, DateTime):
+            data[column.name] = pd.Timestamp('2021-01-01') + pd.to_timedelta(
+                rng.integers(0, 365 * 24 * 3600, rows), unit='s'
+            )
+
+    return pd.DataFrame(data)
+
+
+def truncated_tables(table_name: str) -> list[str]:
+    """
+    The table and the tables maintained from it, insert_records keeps them in step. Delta
+    upload fingerprints and digests go too, TRUNCATE does not forget them like writes do.
+    """
+    if table_name == 'hired_employees':
+        return [table_name, 'hired_employees_quarterly', 'row_fingerprints', 'file_digests']
+
+    return [table_name, 'row_fingerprints', 'file_digests']
+
+
+def run(table_name: str, rows: int, repeat: int) -> dict:
+    df = synthetic_frame(table_name, rows)
+    results = {}
+
+    for method in LOAD_METHODS:
+        timings = []
+        for _ in range(repeat):
+            with engine.begin() as conn:
+                conn.execute(text(f"TRUNCATE TABLE {', '.join(truncated_tables(table_name))}"))
+
+            start = time.perf_counter()
+            result = insert_records(table_name, df, ['id'], method)
+            timings.append(time.perf_counter() - start)
+
+            if not result.ok:
+                raise RuntimeError(result.message)
+
+        best = min(timings)
+        results[method] = {
+            'seconds': best,
+            'rows_per_second': rows / best
+        }
+
+    results['speedup'] = results['insert']['seconds'] / results['copy']['seconds']
+
+    return {'table': table_name, 'rows': rows, 'repeat': repeat, 'results': results}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--table', default='hired_employees')
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(json.dumps(run(args.table, args.rows, args.repeat), indent=2))
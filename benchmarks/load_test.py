@@ -0,0 +1,95 @@
+"""
+Concurrent load test for the API read endpoints.
+
+Start the API first (uvicorn main:app) and run this against it. Every path is hit by
+the given number of concurrent clients; the report has p50/p99 latency, requests per
+second and errors per path.
+
+Usage:
+    python -m benchmarks.load_test --url http://127.0.0.1:8000 --concurrency 100 --requests 2000
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+
+DEFAULT_PATHS = [
+    '/business/employees_hired_by_q?year=2021',
+    '/business/total_employees_by_department?year=2021',
+    '/get_tables/'
+]
+
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+
+    values = sorted(values)
+    index = min(int(round(pct / 100 * (len(values) - 1))), len(values) - 1)
+
+    return values[index]
+
+
+async def hit(client: httpx.AsyncClient, path: str, concurrency: int, requests: int) -> dict:
+    """
+    Send requests to one path from concurrent clients.
+
+    Args:
+        client (httpx.AsyncClient): Client pointing to the API.
+        path (str): Path and query string to request.
+        concurrency (int): Number of concurrent clients.
+        requests (int): Total number of requests.
+
+    Returns:
+        dict: Latency percentiles in milliseconds, throughput and errors.
+    """
+    latencies = []
+    errors = 0
+    pending = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for _ in pending:
+            start = time.perf_counter()
+            try:
+                response = await client.get(path)
+                if response.status_code >= 400:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - start
+
+    return {
+        'path': path,
+        'requests': requests,
+        'concurrency': concurrency,
+        'errors': errors,
+        'requests_per_second': requests / elapsed,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000
+    }
+
+
+async def main(url: str, paths: list[str], concurrency: int, requests: int) -> list[dict]:
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60) as client:
+        return [await hit(client, path, concurrency, requests) for path in paths]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://127.0.0.1:8000')
+    parser.add_argument('--path', action='append', dest='paths', help='Path to hit, can be repeated')
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument('--requests', type=int, default=2000)
+    args = parser.parse_args()
+
+    report = asyncio.run(main(args.url, args.paths or DEFAULT_PATHS, args.concurrency, args.requests))
+    print(json.dumps(report, indent=2))
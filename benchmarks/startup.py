@@ -0,0 +1,73 @@
+"""
+Import time benchmark of the API entry point, to catch startup regressions.
+
+Every run imports main in a fresh interpreter with -X importtime. Importing main must not
+touch the database (it is initialized in the lifespan hook), so no DB is needed. The report
+has the median wall time, the slowest imports and whether heavy modules were loaded.
+
+Usage:
+    python -m benchmarks.startup --runs 5
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+# Modules that must only be loaded on first use
+HEAVY_MODULES = ('pandas', 'numpy', 'pyarrow')
+
+CHECK_HEAVY = (
+    'import sys, json, main; '
+    f'print(json.dumps([name for name in {HEAVY_MODULES!r} if name in sys.modules]))'
+)
+
+
+def slowest_imports(importtime_log: str, top: int) -> list[dict]:
+    """Parse a -X importtime log and return the imports with the highest cumulative time."""
+    imports = []
+    for line in importtime_log.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+
+        _, cumulative, name = line[len('import time:'):].split('|')
+        imports.append({'module': name.strip(), 'cumulative_ms': int(cumulative) / 1000})
+
+    return sorted(imports, key=lambda item: item['cumulative_ms'], reverse=True)[:top]
+
+
+def run(runs: int, top: int) -> dict:
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        process = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', 'import main'],
+            capture_output=True, text=True, check=True
+        )
+        timings.append(time.perf_counter() - start)
+
+    heavy = subprocess.run(
+        [sys.executable, '-c', CHECK_HEAVY],
+        capture_output=True, text=True, check=True
+    )
+
+    return {
+        'runs': runs,
+        'median_ms': statistics.median(timings) * 1000,
+        'min_ms': min(timings) * 1000,
+        'heavy_modules_loaded': json.loads(heavy.stdout.strip().splitlines()[-1]),
+        'slowest_imports': slowest_imports(process.stderr, top)
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15)
+    args = parser.parse_args()
+
+    report = run(args.runs, args.top)
+    print(json.dumps(report, indent=2))
+
+    sys.exit(1 if report['heavy_modules_loaded'] else 0)
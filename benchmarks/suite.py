@@ -0,0 +1,424 @@
+"""
+End to end benchmark of the ingestion functions and the business queries on synthetic data.
+
+Generates departments, jobs and hired_employees CSVs (seeded, so runs are reproducible),
+then drives process_csv, insert_records, update_records, delete_records and both
+app/business.py queries. The hired_employees update file mixes rows sent again unchanged
+(--duplicate-ratio), rows with changed values (--changed-ratio) and new rows.
+
+Needs the database from docker-compose.yml running, or any Postgres set in DATABASE_URL
+(e.g. an ephemeral container). The data tables are truncated before every repetition, so
+do not point it to a database with data you want to keep.
+
+The JSON report has seconds percentiles, rows per second and peak RSS of every stage;
+pass --baseline with a previous report to add the ratio against it.
+
+Usage:
+    python -m benchmarks.suite --rows 100000 --repeat 3 --output bench_100k.json
+    python -m benchmarks.suite --rows 10000000 --method copy --baseline bench_10m.json
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+import sqlalchemy
+from sqlalchemy import text
+
+from app.config import engine, LOAD_METHODS
+from app import business
+from app.utils import process_csv, insert_records, update_records, delete_records
+from app.results import OperationResult
+from benchmarks.load_test import percentile
+
+# Delta upload fingerprints and digests are truncated too, TRUNCATE does not forget them like writes do
+DATA_TABLES = ('hired_employees_quarterly', 'hired_employees', 'jobs', 'departments', 'row_fingerprints', 'file_digests')
+HIRED_COLUMNS = ['id', 'name', 'datetime', 'department_id', 'job_id']
+
+# Rows generated and written per CSV block, keeps memory flat for large scales
+GENERATE_BLOCK_ROWS = 1000000
+
+
+def current_rss() -> int:
+    """Resident memory of this process in bytes, 0 when the platform does not expose it."""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+    except (OSError, ValueError, AttributeError):
+        pass
+
+    try:
+        import resource
+        # Peak instead of current, ru_maxrss is in KB on Linux and bytes on macOS
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss if platform.system() == 'Darwin' else maxrss * 1024
+
+    except ImportError:
+        return 0
+
+
+class RssSampler(threading.Thread):
+    """Thread sampling the process RSS to find the peak of a stage."""
+
+    def __init__(self, interval: float = 0.01):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak = current_rss()
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.peak = max(self.peak, current_rss())
+
+    def stop(self) -> int:
+        self.stopped.set()
+        self.join()
+        self.peak = max(self.peak, current_rss())
+
+        return self.peak
+
+
+@contextmanager
+def measure(runs: dict, stage: str, rows: int):
+    """
+    Time a stage and sample its peak RSS, appending the run to runs[stage].
+
+    Yields:
+        dict: Set 'rows' in it when the row count is only known inside the block.
+    """
+    info = {'rows': rows}
+    sampler = RssSampler()
+    sampler.start()
+    start = time.perf_counter()
+    try:
+        yield info
+
+    finally:
+        seconds = time.perf_counter() - start
+        runs.setdefault(stage, []).append({
+            'seconds': seconds,
+            'rows': info['rows'],
+            'peak_rss_bytes': sampler.stop()
+        })
+
+
+def hired_block(rng: np.random.Generator, ids: np.ndarray, departments: int, jobs: int) -> pd.DataFrame:
+    """Random hired_employees rows, with about 1% nulls in the foreign keys like the challenge data."""
+    rows = len(ids)
+    seconds = rng.integers(0, 2 * 365 * 24 * 3600, rows)
+    hired = pd.Timestamp('2021-01-01', tz='UTC') + pd.to_timedelta(seconds, unit='s')
+
+    department_id = pd.Series(rng.integers(1, departments + 1, rows), dtype='Int64')
+    job_id = pd.Series(rng.integers(1, jobs + 1, rows), dtype='Int64')
+    department_id[rng.random(rows) < 0.01] = pd.NA
+    job_id[rng.random(rows) < 0.01] = pd.NA
+
+    return pd.DataFrame({
+        'id': ids,
+        'name': [f'Employee {i}' for i in ids],
+        'datetime': hired.strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'department_id': department_id,
+        'job_id': job_id
+    })
+
+
+def generate_dataset(
+    data_dir: str,
+    rows: int,
+    departments: int,
+    jobs: int,
+    update_fraction: float,
+    duplicate_ratio: float,
+    changed_ratio: float,
+    seed: int
+) -> dict:
+    """
+    Write the CSV files of a run, named after their tables and without header like the uploads.
+
+    Args:
+        data_dir (str): Folder for the files, the update file goes to data_dir/update.
+        rows (int): hired_employees rows of the initial load.
+        departments (int): Number of departments.
+        jobs (int): Number of jobs.
+        update_fraction (float): Rows of the update file, as a fraction of rows.
+        duplicate_ratio (float): Share of the update file sent again without changes.
+        changed_ratio (float): Share of the update file with changed values.
+        seed (int): Random seed.
+
+    Returns:
+        dict: Paths of the files and row counts.
+    """
+    rng = np.random.default_rng(seed)
+    update_dir = os.path.join(data_dir, 'update')
+    os.makedirs(update_dir, exist_ok=True)
+
+    paths = {
+        'departments': os.path.join(data_dir, 'departments.csv'),
+        'jobs': os.path.join(data_dir, 'jobs.csv'),
+        'hired_employees': os.path.join(data_dir, 'hired_employees.csv'),
+        'update': os.path.join(update_dir, 'hired_employees.csv')
+    }
+
+    pd.DataFrame({
+        'id': np.arange(1, departments + 1),
+        'department': [f'Department {i}' for i in range(1, departments + 1)]
+    }).to_csv(paths['departments'], header=False, index=False)
+
+    pd.DataFrame({
+        'id': np.arange(1, jobs + 1),
+        'job': [f'Job {i}' for i in range(1, jobs + 1)]
+    }).to_csv(paths['jobs'], header=False, index=False)
+
+    if os.path.exists(paths['hired_employees']):
+        os.remove(paths['hired_employees'])
+
+    for start in range(1, rows + 1, GENERATE_BLOCK_ROWS):
+        ids = np.arange(start, min(start + GENERATE_BLOCK_ROWS, rows + 1))
+        hired_block(rng, ids, departments, jobs).to_csv(
+            paths['hired_employees'], mode='a', header=False, index=False
+        )
+
+    # Update file: unchanged and changed rows are existing ids, the rest are new ids
+    update_rows = int(rows * update_fraction)
+    duplicates = int(update_rows * duplicate_ratio)
+    changed = int(update_rows * changed_ratio)
+    new = max(update_rows - duplicates - changed, 0)
+
+    existing_ids = rng.choice(rows, size=duplicates + changed, replace=False) + 1
+    changed_ids = existing_ids[duplicates:]
+
+    # Read the existing rows back as text, block by block, so they are re-sent exactly as stored
+    with pd.read_csv(
+        paths['hired_employees'], header=None, names=HIRED_COLUMNS, dtype=str,
+        keep_default_na=False, chunksize=GENERATE_BLOCK_ROWS
+    ) as reader:
+        stored = pd.concat(
+            [block[block['id'].astype(int).isin(existing_ids)] for block in reader],
+            ignore_index=True
+        )
+    is_changed = stored['id'].astype(int).isin(changed_ids)
+
+    unchanged_rows = stored[~is_changed]
+    changed_rows = stored[is_changed].copy()
+    changed_rows['name'] = changed_rows['name'] + ' changed'
+    changed_rows['job_id'] = rng.integers(1, jobs + 1, len(changed_rows)).astype(str)
+    new_rows = hired_block(rng, np.arange(rows + 1, rows + new + 1), departments, jobs)
+
+    pd.concat([unchanged_rows, changed_rows, new_rows], ignore_index=True).sample(
+        frac=1, random_state=seed
+    ).to_csv(paths['update'], header=False, index=False)
+
+    return {
+        'paths': paths,
+        'rows': {
+            'departments': departments,
+            'jobs': jobs,
+            'hired_employees': rows,
+            'update': duplicates + changed + new,
+            'update_unchanged': duplicates,
+            'update_changed': changed,
+            'update_new': new
+        }
+    }
+
+
+def reset_tables():
+    with engine.begin() as conn:
+        conn.execute(text(f"TRUNCATE TABLE {', '.join(DATA_TABLES)}"))
+
+
+def check(result: OperationResult) -> OperationResult:
+    if not result.ok:
+        raise RuntimeError(f'{result.operation} failed: {result.message}')
+
+    return result
+
+
+def run_process_csv(runs: dict, name: str, file_path: str, work_dir: str) -> pd.DataFrame:
+    """
+    process_csv removes the file it reads, so every run parses a fresh copy. Stages are
+    keyed by file (process_csv.<name>), so rows per second compares runs of the same file.
+    """
+    work_path = os.path.join(work_dir, os.path.basename(file_path))
+    shutil.copyfile(file_path, work_path)
+
+    with measure(runs, f'process_csv.{name}', 0) as stage:
+        result = check(process_csv(work_path))
+        df = result.frame
+        stage['rows'] = df.shape[0]
+
+    # Synthetic rows are all valid, rejects mean the stages below would time partial loads
+    if result.rejected:
+        raise RuntimeError(f'process_csv rejected {result.rejected} rows of {file_path}, see reject file {result.reject_id}')
+
+    return df
+
+
+def run_repetition(runs: dict, dataset: dict, work_dir: str, method: str, query_runs: int, delete_fraction: float, year: int):
+    reset_tables()
+    paths = dataset['paths']
+
+    # Tables are parsed after the tables they reference are loaded, so reference validation passes
+    frames = {}
+    for table_name in ('departments', 'jobs', 'hired_employees'):
+        df = frames[table_name] = run_process_csv(runs, table_name, paths[table_name], work_dir)
+        with measure(runs, f'insert_records.{table_name}', df.shape[0]):
+            check(insert_records(table_name, df, ['id'], method))
+
+    update_df = run_process_csv(runs, 'update', paths['update'], work_dir)
+
+    with measure(runs, 'update_records', update_df.shape[0]):
+        check(update_records('hired_employees', update_df, ['id'], method))
+
+    for source in ('aggregates', 'raw'):
+        for query in (business.employees_hired_q_2021, business.total_employees_by_department):
+            # Bypass the result cache, every run hits the database
+            uncached = query.__wrapped__
+            for _ in range(query_runs):
+                with measure(runs, f'{query.__name__}.{source}', 0):
+                    uncached(year, source)
+
+    delete_ids = frames['hired_employees'][['id']].sample(frac=delete_fraction, random_state=0)
+    with measure(runs, 'delete_records', delete_ids.shape[0]):
+        check(delete_records('hired_employees', delete_ids, ['id']))
+
+
+def summarize(stage_runs: list[dict]) -> dict:
+    seconds = [run['seconds'] for run in stage_runs]
+    rows = stage_runs[0]['rows']
+    p50 = percentile(seconds, 50)
+
+    summary = {
+        'runs': len(stage_runs),
+        'rows': rows,
+        'seconds_p50': p50,
+        'seconds_p95': percentile(seconds, 95),
+        'seconds_p99': percentile(seconds, 99),
+        'seconds_max': max(seconds),
+        'peak_rss_mb': max(run['peak_rss_bytes'] for run in stage_runs) / 1024 ** 2
+    }
+    if rows:
+        summary['rows_per_second'] = rows / p50 if p50 else None
+
+    return summary
+
+
+def environment() -> dict:
+    with engine.connect() as conn:
+        server_version = conn.execute(text('SHOW server_version')).scalar()
+
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'sqlalchemy': sqlalchemy.__version__,
+        'postgres': server_version
+    }
+
+
+def compare(stages: dict, baseline: dict) -> dict:
+    """p50 ratio of every stage against a previous report, above 1 means slower now."""
+    ratios = {}
+    for stage, summary in stages.items():
+        previous = baseline.get('stages', {}).get(stage)
+        if previous and previous['seconds_p50']:
+            ratios[stage] = summary['seconds_p50'] / previous['seconds_p50']
+
+    return ratios
+
+
+def run(args) -> dict:
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix='bench_data_')
+    work_dir = tempfile.mkdtemp(prefix='bench_work_')
+
+    try:
+        setup_runs = {}
+        with measure(setup_runs, 'generate', args.rows):
+            dataset = generate_dataset(
+                data_dir, args.rows, args.departments, args.jobs,
+                args.update_fraction, args.duplicate_ratio, args.changed_ratio, args.seed
+            )
+
+        runs = {}
+        for _ in range(args.repeat):
+            run_repetition(runs, dataset, work_dir, args.method, args.query_runs, args.delete_fraction, args.year)
+
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        if not args.data_dir and not args.keep_data:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    report = {
+        'config': {
+            'rows': args.rows,
+            'departments': args.departments,
+            'jobs': args.jobs,
+            'update_fraction': args.update_fraction,
+            'duplicate_ratio': args.duplicate_ratio,
+            'changed_ratio': args.changed_ratio,
+            'delete_fraction': args.delete_fraction,
+            'method': args.method,
+            'repeat': args.repeat,
+            'query_runs': args.query_runs,
+            'year': args.year,
+            'seed': args.seed
+        },
+        'environment': environment(),
+        'dataset': {**dataset['rows'], 'generate_seconds': setup_runs['generate'][0]['seconds']},
+        'stages': {stage: summarize(stage_runs) for stage, stage_runs in runs.items()}
+    }
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            report['baseline_p50_ratio'] = compare(report['stages'], json.load(baseline_file))
+
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=100000, help='hired_employees rows, e.g. 10000 to 10000000')
+    parser.add_argument('--departments', type=int, default=12)
+    parser.add_argument('--jobs', type=int, default=183)
+    parser.add_argument('--update-fraction', type=float, default=0.1, help='Rows of the update file over rows')
+    parser.add_argument('--duplicate-ratio', type=float, default=0.3, help='Update rows sent again unchanged')
+    parser.add_argument('--changed-ratio', type=float, default=0.3, help='Update rows with changed values')
+    parser.add_argument('--delete-fraction', type=float, default=0.05, help='Initial rows deleted at the end')
+    parser.add_argument('--method', choices=LOAD_METHODS, default='copy')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--query-runs', type=int, default=20, help='Runs of every business query per repetition')
+    parser.add_argument('--year', type=int, default=2021)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--data-dir', help='Keep the generated CSVs in this folder')
+    parser.add_argument('--keep-data', action='store_true', help='Do not delete the generated temporary folder')
+    parser.add_argument('--output', help='Write the JSON report to this file')
+    parser.add_argument('--baseline', help='Previous JSON report to compare against')
+    args = parser.parse_args()
+
+    report = run(args)
+    output = json.dumps(report, indent=2)
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            output_file.write(output)
+
+    print(output)
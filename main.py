@@ -1,13 +1,35 @@
 from fastapi import FastAPI
+from contextlib import asynccontextmanager
 from app.operations import init_operations
-from app.config import init_db
+from app.metrics import init_metrics
+from app.config import init_db, engine, read_engine
+from app.catalog import invalidate_catalog
+from app.aggregates import init_quarterly_aggregates
+from app.concurrency import run_db
+
+
+def startup():
+    # Initialize database once per worker, the catalog registry reloads on first use
+    init_db()
+    invalidate_catalog()
+    init_quarterly_aggregates()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await run_db(startup)
+    yield
+    engine.dispose()
+    if read_engine is not engine:
+        read_engine.dispose()
+
 
 # FastAPI initialization
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
-# Initialize database and routes
-init_db()
+# Initialize routes and request instrumentation
 init_operations(app)
+init_metrics(app)
 
 @app.get('/')
 def root():